@@ -1,7 +1,15 @@
 from nicegui import ui, app
 from layout.page import get_tool_menu
 from .api import load_matter_field_values
+from .client import close_async_clients
 from .page import customfield_management_page
+from .storage import get_storage, close_storage
+from .usage import close_usage_indexes
+
+# Pooled Clio connections and the storage backend outlive page visits, release them with the server
+app.on_shutdown(close_async_clients)
+app.on_shutdown(close_storage)
+app.on_shutdown(close_usage_indexes)
 
 def update_nav_menu():
     tool_menu = get_tool_menu()
@@ -14,23 +22,28 @@ def update_nav_menu():
                 ui.menu_item('Contacts', on_click= lambda: ui.navigate.to('/app/customfield_management/contact'))
         
 def init_storage():
-    # Initialize the root storage dictionary
-    page_data: dict = app.storage.general.setdefault('customfield_management_storage', {})
-
-    # Initialize flat dictionaries for all fields and field sets by ID
-    page_data.setdefault('custom_field_data', {})
-    page_data.setdefault('custom_field_set_data', {})
-    page_data.setdefault('custom_field_map', {})
-    page_data.setdefault('custom_field_set_map', {})
-
-    # Initialize per-category sorted ID lists
-    for category in ['matter', 'contact']:
-        category_data = page_data.setdefault(category, {})
-        category_data.setdefault('custom_field_id_list', [])
-        category_data.setdefault('custom_field_set_id_list', [])
-    
-    # Add user API keys
-    page_data.setdefault('clio_api_keys', {})
+    # Initialize the root storage dictionary, written once at the end
+    page_data: dict = get_storage()
+    with page_data.transaction():
+
+        # Initialize flat dictionaries for all fields and field sets by ID
+        page_data.setdefault('custom_field_data', {})
+        page_data.setdefault('custom_field_set_data', {})
+
+        # Initialize per-category sorted ID lists
+        for category in ['matter', 'contact']:
+            category_data = page_data.setdefault(category, {})
+            if 'custom_field_id_list' not in category_data:
+                category_data['custom_field_id_list'] = [int(field_id) for field_id in page_data.record_ids('custom_field_data', category)]
+            category_data.setdefault('custom_field_set_id_list', [])
+
+        # Add user API keys
+        page_data.setdefault('clio_api_keys', {})
+
+        # Field usage moved to the per-token usage index
+        for key in ('field_usage', 'field_usage_matter_count'):
+            if key in page_data:
+                del page_data[key]
 
 def init():
     # from .page import customfield_management_page
@@ -6,28 +6,54 @@ from nicegui import ui, app
 
 from clio_manage_python_client import ClioManage as Client
 
+from .client import AsyncClioClient, get_async_client
+from .indexes import field_indexes, index_custom_field
+from .storage import get_storage
+
 logging.basicConfig(level=logging.DEBUG)
-    
+
+CUSTOM_FIELD_FIELDS = "id,etag,name,parent_type,field_type,displayed,deleted,required,display_order,updated_at,picklist_options{id,etag,option,deleted_at}"
+CUSTOM_FIELD_SET_FIELDS = "id,etag,name,parent_type,displayed,updated_at,custom_fields{id,etag}"
+MATTER_FIELD_VALUE_FIELDS = "id,display_number,description,custom_field_values{id,field_name,field_display_order,value,soft_deleted}"
+
+def resolve_async_client(client=None) -> AsyncClioClient:
+    """Return the pooled async client for the tab's (or the given) Clio token."""
+    if isinstance(client, AsyncClioClient):
+        return client
+    if client is None:
+        client = app.storage.tab['custom_field_management_api']
+    return get_async_client(client.access_token)
+
+def store_display_order_response(data: dict) -> None:
+    """Update general storage after API reorder, excluding 'id' from value."""
+    storage = get_storage()["custom_field_data"]
+
+    field_id = str(data.get("id"))
+    if field_id and isinstance(storage.get(field_id), dict):
+        filtered_data = {k: v for k, v in data.items() if k != "id"}
+        get_storage()["custom_field_data"][field_id]=filtered_data
+        index_custom_field(field_id, filtered_data)
+
+def store_display_order_results(results) -> None:
+    """Store the records returned by one dispatch wave of display_order PATCHes in a single write."""
+    with get_storage().transaction():
+        for result in results:
+            if result.landed and isinstance(result.response, dict):
+                store_display_order_response(result.response)
+
 def update_custom_field_display_order(field_id, new_position):
     client = app.storage.tab['custom_field_management_api']
     field_id=str(field_id)
     new_position=str(new_position)
 
     try:
-        response = client.patch.custom_fields(id=field_id, display_order=new_position, fields="id,etag,name,parent_type,field_type,displayed,deleted,required,display_order,picklist_options{id,etag,option,deleted_at}")
+        response = client.patch.custom_fields(id=field_id, display_order=new_position, fields=CUSTOM_FIELD_FIELDS)
         data = response.get("data")
         if not data:
             logging.debug(f"❌ Failed to get data for field {field_id}")
             return False
         
-        """Update general storage after API reorder, excluding 'id' from value."""
-        storage = app.storage.general["customfield_management_storage"]["custom_field_data"]
-        
-        field_id = str(data.get("id"))
-        if field_id and isinstance(storage.get(field_id), dict):
-            filtered_data = {k: v for k, v in data.items() if k != "id"}
-            app.storage.general["customfield_management_storage"]["custom_field_data"][field_id]=filtered_data
-            
+        store_display_order_response(data)
         logging.debug(json.dumps(response, indent=2))
         return True
     
@@ -50,7 +76,7 @@ def get_custom_field(client:Client=None, **kwargs):
 def get_custom_fields(client: Client = None, parent_type=None, **kwargs):
     try:
         params = {
-            "fields": "id,etag,name,parent_type,field_type,displayed,deleted,required,display_order,picklist_options{id,etag,option,deleted_at}",
+            "fields": CUSTOM_FIELD_FIELDS,
             "order": "display_order(asc)",
         }
 
@@ -67,7 +93,7 @@ def get_custom_fields(client: Client = None, parent_type=None, **kwargs):
 
 def get_custom_field_sets(client:Client=None, parent_type=None, **kwargs):
     params = {
-        "fields": "id,etag,name,parent_type,displayed,custom_fields{id,etag}",
+        "fields": CUSTOM_FIELD_SET_FIELDS,
     }
     
     if parent_type is not None:
@@ -113,10 +139,7 @@ def delete_custom_field(client, field_id):
     except Exception as e:
         logging.debug(f"An error occurred: {e}")
 
-def create_custom_field(client, **kwargs):
-    storage = app.storage.general.get("customfield_management_storage", {})
-    custom_field_data = storage.get("custom_field_data", {})
-
+def prepare_custom_field_kwargs(**kwargs) -> dict:
     # Clean kwargs of None, empty list, empty dict, and empty string
     cleaned_kwargs = {
         k: v for k, v in kwargs.items()
@@ -127,13 +150,13 @@ def create_custom_field(client, **kwargs):
     if not cleaned_kwargs.get("display_order"):  
         parent_type = cleaned_kwargs.get("parent_type").title()
         if parent_type:
-            # Get all display_order values for the same parent_type
-            matching_orders = [
-                field.get("display_order", 0)
-                for field in custom_field_data.values()
-                if field.get("parent_type") == parent_type and isinstance(field.get("display_order"), int)
-            ]
-            cleaned_kwargs["display_order"] = (max(matching_orders) + 1) if matching_orders else 1
+            max_order = field_indexes.max_display_order(parent_type)
+            cleaned_kwargs["display_order"] = (max_order + 1) if max_order is not None else 1
+
+    return cleaned_kwargs
+
+def create_custom_field(client, **kwargs):
+    cleaned_kwargs = prepare_custom_field_kwargs(**kwargs)
 
     try:
         response = client.post.custom_fields(**cleaned_kwargs)
@@ -159,13 +182,174 @@ def create_custom_field_set(client, **kwargs):
 def load_matter_field_values(**kwargs):
     try:
         client = app.storage.tab['custom_field_management_api']
-        # response = client.get.matters(fields='id,display_number,description,custom_field_values{id,field_name,field_display_order,value,soft_deleted},user{all}', **kwargs)
-        # app.storage.general['matters'] = response.get('data')
-        response = client.get.matters(fields='id,display_number,description,custom_field_values{id,field_name,field_display_order,value,soft_deleted}', custom_field_ids = [5677876])
-        app.storage.general['matter_query'] = response.get('data')
-        logging.debug(json.dumps(response, indent=2))
+        # Usage across all matters is aggregated by usage.UsageAnalysis, this reads one page
+        response = client.get.matters(fields=MATTER_FIELD_VALUE_FIELDS, **kwargs)
         return response
     
     except Exception as e:
         logging.debug(f"An error occurred: {e}")
-        return False
\ No newline at end of file
+        return False
+
+# Async API
+# Awaitable counterparts of the functions above. They run on the pooled httpx client
+# for the tab's access token so UI handlers never block the event loop.
+
+async def update_custom_field_display_order_async(field_id, new_position, client=None, store=True):
+    """PATCH one display_order. With store=False the record is returned for `store_display_order_results` instead of written."""
+    try:
+        # Inside the try: from a task without page context a missing client is a failed call, not a crash
+        client = resolve_async_client(client)
+        response = await client.patch(f"custom_fields/{field_id}.json", {"display_order": int(new_position)}, fields=CUSTOM_FIELD_FIELDS)
+        data = response.get("data")
+        if not data:
+            logging.debug(f"❌ Failed to get data for field {field_id}")
+            return False
+
+        if not store:
+            return data
+        store_display_order_response(data)
+        logging.debug(json.dumps(response, indent=2))
+        return True
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+        return False
+
+async def get_custom_field_async(client=None, **kwargs):
+    assert kwargs.get('id')
+    client = resolve_async_client(client)
+
+    field_id = kwargs.pop('id')
+    kwargs.setdefault('fields', 'all')
+    try:
+        response = await client.get(f"custom_fields/{field_id}.json", **kwargs)
+        logging.debug(json.dumps(response, indent=2))
+        return response
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+
+async def get_custom_fields_async(client=None, parent_type=None, **kwargs):
+    client = resolve_async_client(client)
+    try:
+        params = {
+            "fields": CUSTOM_FIELD_FIELDS,
+            "order": "display_order(asc)",
+        }
+
+        if parent_type is not None:
+            params["parent_type"] = parent_type.title()
+
+        params.update(kwargs)
+
+        response = await client.all("custom_fields.json", **params)
+        return response
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+
+async def iter_custom_fields_async(client=None, parent_type=None, **kwargs):
+    """Yield custom fields one Clio page at a time, in display_order. Errors are left to the caller."""
+    client = resolve_async_client(client)
+    params = {
+        "fields": CUSTOM_FIELD_FIELDS,
+        "order": "display_order(asc)",
+    }
+
+    if parent_type is not None:
+        params["parent_type"] = parent_type.title()
+
+    params.update(kwargs)
+
+    async for data, _ in client.pages("custom_fields.json", **params):
+        yield data
+
+async def get_custom_field_sets_async(client=None, parent_type=None, **kwargs):
+    client = resolve_async_client(client)
+    params = {
+        "fields": CUSTOM_FIELD_SET_FIELDS,
+    }
+
+    if parent_type is not None:
+        params["parent_type"] = parent_type.title()
+
+    params.update(kwargs)
+
+    try:
+        response = await client.all("custom_field_sets.json", **params)
+        return response
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+
+async def update_custom_field_async(client=None, **kwargs):
+    client = resolve_async_client(client)
+    field_id = kwargs.pop('id')
+    try:
+        response = await client.patch(f"custom_fields/{field_id}.json", kwargs, fields="all,picklist_options{all}")
+
+        logging.debug(json.dumps(response, indent=2))
+        return response
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+        return False
+
+async def update_custom_field_set_label_async(client, fieldset_id, new_name):
+    client = resolve_async_client(client)
+    try:
+        response = await client.patch(f"custom_field_sets/{fieldset_id}.json", {"name": new_name}, fields="name")
+        logging.debug(json.dumps(response, indent=2))
+        return {"Success": True}
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+
+async def delete_custom_field_async(client, field_id):
+    client = resolve_async_client(client)
+    try:
+        response = await client.delete(f"custom_fields/{field_id}.json")
+        logging.debug(json.dumps(response, indent=2))
+        ui.notify(f"Successfully deleted: {field_id}")
+        return {"Success": True}
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+
+async def create_custom_field_async(client=None, **kwargs):
+    client = resolve_async_client(client)
+    cleaned_kwargs = prepare_custom_field_kwargs(**kwargs)
+    fields = cleaned_kwargs.pop('fields', None)
+
+    try:
+        response = await client.post("custom_fields.json", cleaned_kwargs, **({"fields": fields} if fields else {}))
+        logging.debug(json.dumps(response, indent=2))
+        return response
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+        return False
+
+async def create_custom_field_set_async(client=None, **kwargs):
+    client = resolve_async_client(client)
+    fields = kwargs.pop('fields', 'all')
+    kwargs.setdefault('parent_type', 'matter')
+    kwargs['parent_type'] = kwargs['parent_type'].title()
+    try:
+        response = await client.post("custom_field_sets.json", kwargs, fields=fields)
+        logging.debug(json.dumps(response, indent=2))
+        return True
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+        return False
+
+async def load_matter_field_values_async(**kwargs):
+    try:
+        client = resolve_async_client(kwargs.pop('client', None))
+        response = await client.get("matters.json", fields=MATTER_FIELD_VALUE_FIELDS, **kwargs)
+        return response
+
+    except Exception as e:
+        logging.debug(f"An error occurred: {e}")
+        return False
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import AsyncIterator
+
+import httpx
+
+logging.basicConfig(level=logging.DEBUG)
+
+BASE_URL = {
+    "us": "https://app.clio.com",
+    "au": "https://au.app.clio.com",
+    "ca": "https://ca.app.clio.com",
+    "eu": "https://eu.app.clio.com"
+}
+API_VERSION_PATH = "api/v4"
+
+# Clio caps index pages at 200 records
+PAGE_LIMIT = 200
+
+# URLs whose last etag and body are kept for If-None-Match, least recently used dropped first
+ETAG_CACHE_SIZE = 256
+
+# Seconds a finished `all()` result is served to other callers (tabs) without asking Clio again
+RESULT_CACHE_TTL = 5.0
+
+# Throttled requests are retried this many times before the 429 is raised
+MAX_RATE_LIMIT_RETRIES = 5
+
+class AsyncClioClient:
+    """Awaitable Clio v4 client backed by one pooled keep-alive httpx connection pool."""
+
+    def __init__(self, access_token: str, region: str = "us", max_connections: int = 10, timeout: float = 30.0) -> None:
+        self.access_token = access_token
+        self.base_url = f"{BASE_URL.get(region.lower(), BASE_URL['us'])}/{API_VERSION_PATH}/"
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        # Monotonic time before which no request is sent, shared by every caller of this token
+        self.resume_at = 0.0
+        # (path, query) -> (etag, body) of the last conditional GET, for If-None-Match
+        self.etags: OrderedDict[tuple, tuple[str, dict]] = OrderedDict()
+        # (path, query) -> shared task of an `all()` in flight with the write count it started at,
+        # and (finished at, result) of recent ones
+        self.inflight: dict[tuple, tuple[asyncio.Task, int]] = {}
+        self.results: dict[tuple, tuple[float, dict]] = {}
+        # Bumped by every write, a walk that overlapped one is not cached
+        self.writes = 0
+
+    @staticmethod
+    def cache_key(path: str, params: dict = None) -> tuple:
+        return path, tuple(sorted((name, str(value)) for name, value in (params or {}).items()))
+
+    async def wait_for_rate_limit(self) -> None:
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def throttle(self, response: httpx.Response, attempt: int) -> float:
+        """Push back every request on this token by Retry-After (or an exponential fallback)."""
+        try:
+            delay = float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            delay = min(2 ** attempt, 60)
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        return delay
+
+    async def send(self, method: str, path: str, params: dict = None, data: dict = None, headers: dict = None) -> httpx.Response:
+        """Send one request, waiting out 429s, and return the raw response."""
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.wait_for_rate_limit()
+            response = await self.http.request(
+                method.upper(),
+                path,
+                params=params or None,
+                json={"data": data} if data is not None else None,
+                headers=headers,
+            )
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                break
+            delay = self.throttle(response, attempt)
+            logging.debug(f"Rate limited on {path}, retrying in {delay:.1f}s")
+        return response
+
+    async def request(self, method: str, path: str, params: dict = None, data: dict = None) -> dict:
+        """Send one request and return the decoded JSON body. Raises httpx.HTTPStatusError on 4xx/5xx."""
+        response = await self.send(method, path, params=params, data=data)
+        if method.upper() != "GET":
+            # A write may change anything a cached listing holds
+            self.writes += 1
+            self.results.clear()
+        response.raise_for_status()
+        if not response.content:
+            return {}
+        return response.json()
+
+    async def get_if_modified(self, path: str, params: dict = None, etag: str = None, conditional: bool = True) -> tuple[dict, bool]:
+        """
+        GET with If-None-Match and return (body, modified).
+
+        The etag is the caller's (e.g. a stored record's) or the one from the last response to
+        the same URL. On 304 the cached body is returned, or {} when only the caller's etag
+        was known. With conditional=False it is a plain GET and nothing is cached.
+        """
+        if not conditional:
+            response = await self.send("GET", path, params=params)
+            response.raise_for_status()
+            return (response.json() if response.content else {}), True
+
+        key = self.cache_key(path, params)
+        cached_etag, cached_body = self.etags.get(key, (None, {}))
+        if key in self.etags:
+            self.etags.move_to_end(key)
+        etag = etag or cached_etag
+
+        response = await self.send("GET", path, params=params, headers={"If-None-Match": etag} if etag else None)
+        if response.status_code == 304:
+            return (cached_body if etag == cached_etag else {}), False
+
+        response.raise_for_status()
+        body = response.json() if response.content else {}
+        if response.headers.get("ETag"):
+            self.etags[key] = (response.headers["ETag"], body)
+            self.etags.move_to_end(key)
+            while len(self.etags) > ETAG_CACHE_SIZE:
+                self.etags.popitem(last=False)
+        return body, True
+
+    async def get(self, path: str, **params) -> dict:
+        return await self.request("GET", path, params=params)
+
+    async def patch(self, path: str, data: dict, **params) -> dict:
+        return await self.request("PATCH", path, params=params, data=data)
+
+    async def post(self, path: str, data: dict, **params) -> dict:
+        return await self.request("POST", path, params=params, data=data)
+
+    async def delete(self, path: str, **params) -> dict:
+        return await self.request("DELETE", path, params=params)
+
+    async def all(self, path: str, max_age: float = RESULT_CACHE_TTL, **params) -> dict:
+        """
+        Follow `meta.paging.next` until exhausted, same shape as `ClioManage.all`.
+
+        Identical concurrent calls (e.g. two tabs loading the same page) share one walk, and
+        its result is reused for `max_age` seconds. Pass 0 to skip the cache and start a fresh
+        walk; a walk that started before a write is never joined either. Every page is a
+        conditional GET; `modified` is False when all of them came back 304.
+        """
+        params.setdefault("limit", PAGE_LIMIT)
+        key = self.cache_key(path, params)
+
+        cached = self.results.get(key)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return {"data": list(cached[1]["data"]), "modified": cached[1]["modified"]}
+
+        task, writes = self.inflight.get(key, (None, None))
+        if task is None or max_age == 0 or writes != self.writes:
+            task = asyncio.create_task(self.fetch_all(key, path, params))
+            self.inflight[key] = (task, self.writes)
+            task.add_done_callback(lambda done: self.inflight.pop(key, None) if self.inflight.get(key, (None,))[0] is done else None)
+        else:
+            logging.debug(f"Joined in-flight load of {path}")
+
+        # A caller going away (closed tab) must not cancel the walk for the others
+        result = await asyncio.shield(task)
+        return {"data": list(result["data"]), "modified": result["modified"]}
+
+    async def fetch_all(self, key: tuple, path: str, params: dict) -> dict:
+        writes = self.writes
+        results = []
+        modified = False
+        async for data, page_modified in self.pages(path, **params):
+            modified = modified or page_modified
+            results.extend(data)
+
+        result = {"data": results, "modified": modified}
+        if writes == self.writes:
+            now = time.monotonic()
+            self.results = {cached_key: cached for cached_key, cached in self.results.items() if now - cached[0] < RESULT_CACHE_TTL}
+            self.results[key] = (now, result)
+        return result
+
+    async def pages(self, path: str, conditional: bool = True, **params) -> AsyncIterator[tuple[list, bool]]:
+        """
+        Yield (records, modified) for each page as `meta.paging.next` is followed, for streaming consumers.
+
+        Large one-off walks (matters) pass conditional=False: their next links carry page
+        tokens that change on every walk, so caching their bodies would never pay off.
+        """
+        params.setdefault("limit", PAGE_LIMIT)
+        next_url = path
+
+        while next_url:
+            # The next link already carries the original query string
+            response, modified = await self.get_if_modified(next_url, params if next_url == path else None, conditional=conditional)
+            yield response.get("data", []), modified
+            next_url = response.get("meta", {}).get("paging", {}).get("next")
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+# One pool per access token, shared by every page visit and tab using that token
+_clients: dict[str, AsyncClioClient] = {}
+
+def get_async_client(access_token: str) -> AsyncClioClient:
+    client = _clients.get(access_token)
+    if client is None or client.http.is_closed:
+        client = _clients[access_token] = AsyncClioClient(access_token)
+        logging.debug("Opened pooled Clio connection")
+    return client
+
+async def release_async_client(access_token: str) -> None:
+    """Close and forget the pool of a token that is no longer used, e.g. after the user switched tokens."""
+    client = _clients.pop(access_token, None)
+    if client is not None:
+        await client.aclose()
+        logging.debug("Closed pooled Clio connection")
+
+async def close_async_clients() -> None:
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+from nicegui import background_tasks
+
+from .dispatcher import Dispatcher, DispatchReport, DispatchResult
+
+logging.basicConfig(level=logging.DEBUG)
+
+Waves = list[list[tuple[Hashable, Callable[[], Awaitable[Any]]]]]
+
+@dataclass
+class CommitJob:
+    label: str
+    waves: Waves
+    labels: dict = field(default_factory=dict)
+    on_wave: Callable[[list[DispatchResult]], None] = None
+
+    @property
+    def size(self) -> int:
+        return sum(len(wave) for wave in self.waves)
+
+class CommitQueue:
+    """
+    FIFO of API work for changes the UI has already applied optimistically.
+
+    Jobs run one at a time through a Dispatcher, so later jobs see the server state the
+    earlier ones produced. When a job does not fully land, every queued job (planned on
+    top of it) is dropped and `on_failure` is awaited to reconcile with the server.
+    """
+
+    def __init__(self, on_failure: Callable[[CommitJob, DispatchReport], Awaitable[None]] = None, max_concurrency: int = 4) -> None:
+        self.on_failure = on_failure
+        self.max_concurrency = max_concurrency
+        self.jobs: asyncio.Queue[CommitJob] = asyncio.Queue()
+        self.dispatcher: Dispatcher = None
+        self.worker: asyncio.Task = None
+
+        # Progress of the current burst of work, bound by the status row
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.busy = False
+        self.status = ''
+        # Bumped by every submitted job, a server listing fetched across a bump predates local changes
+        self.generation = 0
+        # Set while nothing is queued or sending, full loads wait for it
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def changed_since(self, generation: int) -> bool:
+        """True while changes are being sent or when any were made after `generation` was read."""
+        return self.busy or self.generation != generation
+
+    def submit(self, label: str, waves: Waves, labels: dict = None, on_wave: Callable[[list[DispatchResult]], None] = None) -> CommitJob:
+        job = CommitJob(label, waves, labels or {}, on_wave)
+        if not self.busy:
+            self.total = self.done = self.failed = 0
+        self.total += job.size
+        self.generation += 1
+        self.busy = True
+        self.idle.clear()
+        self.update_status()
+
+        self.jobs.put_nowait(job)
+        if self.worker is None or self.worker.done():
+            self.worker = background_tasks.create(self.run(), name='custom_field_commit_queue')
+        return job
+
+    def cancel(self) -> None:
+        """Stop the running job and drop everything queued behind it."""
+        if self.dispatcher:
+            self.dispatcher.cancel()
+        self.drop_queued()
+
+    def drop_queued(self) -> int:
+        dropped = 0
+        while not self.jobs.empty():
+            job = self.jobs.get_nowait()
+            self.total -= job.size
+            dropped += 1
+        return dropped
+
+    def update_status(self) -> None:
+        failed = f" ({self.failed} not applied)" if self.failed else ''
+        self.status = f"Saving {self.done} / {self.total}{failed}" if self.busy else ''
+
+    def record(self, result: DispatchResult) -> None:
+        self.done += 1
+        if not result.landed:
+            self.failed += 1
+        self.update_status()
+
+    async def run(self) -> None:
+        while not self.jobs.empty():
+            job = self.jobs.get_nowait()
+            self.dispatcher = Dispatcher(self.max_concurrency)
+            report = await self.dispatcher.run(job.waves, on_result=self.record, on_wave=job.on_wave)
+            self.dispatcher = None
+            logging.debug(f"Commit '{job.label}': {len(report.landed)}/{len(report.results)} landed in {report.elapsed:.2f}s")
+
+            if report.failed or report.cancelled:
+                dropped = self.drop_queued()
+                logging.debug(f"Commit '{job.label}' did not fully land, dropped {dropped} queued job(s)")
+                if self.on_failure:
+                    # Nothing is left to send, the reconciling load must not wait for this worker
+                    self.mark_idle()
+                    await self.on_failure(job, report)
+
+        self.mark_idle()
+
+    def mark_idle(self) -> None:
+        if self.jobs.empty():
+            self.busy = False
+            self.idle.set()
+            self.update_status()
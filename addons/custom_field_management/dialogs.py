@@ -1,12 +1,12 @@
 import os
 import sys
 from typing import TYPE_CHECKING
-import webbrowser
-from urllib.parse import urlencode
 
-from nicegui import ui, run, app
+from nicegui import ui, app
 
-from .api import create_custom_field_set, update_custom_field, create_custom_field
+from .api import create_custom_field_set_async, update_custom_field_async, create_custom_field_async
+from .indexes import index_custom_field
+from .storage import get_storage
 
 if TYPE_CHECKING:
     from nicegui.events import KeyEventArguments
@@ -105,7 +105,7 @@ async def launch_field_set_dialog(action_type= "post", **kwargs):
         return create_dialog
 
     async def create_field_set(**kwargs):
-        response = await run.io_bound(create_custom_field_set, client=app.storage.tab['custom_field_management_api'], **kwargs)
+        response = await create_custom_field_set_async(client=app.storage.tab['custom_field_management_api'], **kwargs)
         if response:
             ui.notify(f'Field Created: {kwargs}')
         
@@ -257,7 +257,7 @@ async def launch_field_dialog(method= "post", **kwargs):
     async def create_field(**kwargs):
         ui.notify(f'Request: {kwargs}')
         client = app.storage.tab['custom_field_management_api']
-        response = await run.io_bound(create_custom_field, client=client, **kwargs)
+        response = await create_custom_field_async(client=client, **kwargs)
         if response:
             reload_func = app.storage.client['load_field_storage']
             await reload_func()
@@ -283,7 +283,7 @@ async def launch_field_dialog(method= "post", **kwargs):
     if method == "patch" and result:
         field_id = kwargs.get('id')
         
-        field_data = app.storage.general["customfield_management_storage"]["custom_field_data"].get(field_id)
+        field_data = get_storage()["custom_field_data"].get(field_id)
         if not field_data:
             return
         
@@ -317,9 +317,11 @@ async def launch_field_dialog(method= "post", **kwargs):
 
         # print("📦 PATCH Payload:", patch_payload)
         client = app.storage.tab['custom_field_management_api']
-        response = update_custom_field(client=client, **patch_payload).get('data')
+        response = await update_custom_field_async(client=client, **patch_payload)
+        response = response.get('data') if response else None
         if response:
-            app.storage.general["customfield_management_storage"]["custom_field_data"][field_id] = response
+            get_storage()["custom_field_data"][field_id] = response
+            index_custom_field(field_id, response)
 
     if method == "duplicate" and result:
         payload = {
@@ -336,48 +338,26 @@ async def launch_field_dialog(method= "post", **kwargs):
         payload = {k: v for k, v in payload.items() if v is not None}
         await create_field(**payload)
         
-async def fix_field_display_order_dialog(parent_type='matter'):
-        
-    def fix_dialog(parent_type) -> ui.dialog:
-
-        def open_browser(parent_type):
-            base_url = "https://app.clio.com/nc/#/settings"
-            path = "settings/custom_fields"
-            params = {'parent_type': parent_type, 'prefix': 'custom_matter_fields'}
-            full_url = f"{base_url}?path={path}%3F{urlencode(params)}"
-            
-            webbrowser.open(full_url)
-
-        with ui.dialog().classes('w-full max-w-2xl') as dialog, ui.card().classes('w-full p-6 rounded shadow-lg'):
-            with ui.column().classes('w-full gap-3 items-center'):
-                ui.label('⚠️ Custom Field Order Warning').classes('text-xl font-bold text-red-600 text-center')
-                ui.separator()
-                ui.label('The display orders of the Custom Fields are not sequential. Please follow these steps to fix it:') \
-                    .classes('text-base text-gray-700 text-center')
-
-                steps = [
-                    '1) Use the button below to open the Clio Custom Field settings',
-                    '2) Click the "Modify Order" button on the settings page',
-                    '3) Scroll to the bottom and click "Save Order"',
-                    '4) Once complete, return to this page and confirm',
-                ]
-
-                for step in steps:
-                    ui.label(step).classes('text-sm text-gray-600')
-
-                ui.button('🔗 Open Clio Settings', on_click=lambda: open_browser(parent_type)) \
-                    .props('color=primary outline').classes('mt-4 self-center')
-
-            with ui.row().classes('w-full justify-center pt-4'):
-                ui.button('Cancel', on_click=lambda: dialog.submit(False)).props('flat')
-                ui.button('Confirm', on_click=lambda: dialog.submit(True)).props('color=primary')
+async def normalize_display_order_dialog(parent_type: str, call_count: int, field_count: int) -> bool:
+    """Dry-run preview of the display_order normalization, True once the user confirms it."""
+    app.storage.user.setdefault('customfield_auto_normalize', False)
+    with ui.dialog().classes('w-full max-w-2xl') as dialog, ui.card().classes('w-full p-6 rounded shadow-lg'):
+        with ui.column().classes('w-full gap-3 items-center'):
+            ui.label('⚠️ Custom Field Order Warning').classes('text-xl font-bold text-red-600 text-center')
+            ui.separator()
+            ui.label('The display orders of the Custom Fields are not sequential from 0 (gaps, duplicates or an offset).') \
+                .classes('text-base text-gray-700 text-center')
+            ui.label(f'Renumbering keeps the current order and changes {call_count} of {field_count} {parent_type} fields, '
+                     f'{call_count} API call{"s" if call_count != 1 else ""}.') \
+                .classes('text-sm text-gray-600 text-center')
+            ui.checkbox('Fix automatically from now on') \
+                .bind_value(app.storage.user, 'customfield_auto_normalize')
+
+        with ui.row().classes('w-full justify-center pt-4'):
+            ui.button('Cancel', on_click=lambda: dialog.submit(False)).props('flat')
+            ui.button('Normalize', on_click=lambda: dialog.submit(True)).props('color=primary')
 
-        return dialog
-        
-    fix_field_dialog = fix_dialog(parent_type)
-    confirmed = await fix_field_dialog
-    # ui.notify(confirmed)
-    return confirmed
+    return bool(await dialog)
 
 def loading_dialog() -> ui.dialog:
     with ui.dialog() as loading_dialog, ui.card().classes("flex items-center justify-center"):
@@ -387,4 +367,16 @@ def loading_dialog() -> ui.dialog:
             ui.spinner()
 
     loading_dialog.open()
-    return loading_dialog
\ No newline at end of file
+    return loading_dialog
+
+def notify_dispatch_report(report, labels: dict = None) -> None:
+    """Summarize which calls of a dispatch landed and list the ones that did not."""
+    labels = labels or {}
+    summary = f"{len(report.landed)} of {len(report.results)} updates applied in {report.elapsed:.1f}s"
+    not_applied = report.failed + report.cancelled
+    if not not_applied:
+        ui.notify(summary, type='positive')
+        return
+
+    names = '\n'.join(f"• {labels.get(key, key)}" for key in not_applied)
+    ui.notification(f"{summary}\nNot applied:\n{names}", type='warning', multi_line=True, timeout=0, close_button=True)
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logging.basicConfig(level=logging.DEBUG)
+
+@dataclass
+class DispatchResult:
+    key: Hashable
+    landed: bool = False
+    cancelled: bool = False
+    elapsed: float = 0.0
+    response: Any = None
+    error: Optional[str] = None
+
+@dataclass
+class DispatchReport:
+    results: list[DispatchResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def landed(self) -> list[Hashable]:
+        return [r.key for r in self.results if r.landed]
+
+    @property
+    def failed(self) -> list[Hashable]:
+        return [r.key for r in self.results if not r.landed and not r.cancelled]
+
+    @property
+    def cancelled(self) -> list[Hashable]:
+        return [r.key for r in self.results if r.cancelled]
+
+class Dispatcher:
+    """
+    Run API calls in waves with bounded concurrency.
+
+    Calls inside a wave are independent and run up to `max_concurrency` at a time.
+    Waves run in order; once a call fails, later waves are reported as cancelled since
+    they were planned against a state that never happened. Rate limiting (429 and
+    Retry-After) is handled by the pooled client shared by every call. `on_wave` sees
+    each finished wave, e.g. to store its responses in one write.
+    """
+
+    def __init__(self, max_concurrency: int = 4) -> None:
+        self.max_concurrency = max_concurrency
+        self.cancel_requested = False
+
+    def cancel(self) -> None:
+        self.cancel_requested = True
+
+    async def run(
+        self,
+        waves: list[list[tuple[Hashable, Callable[[], Awaitable[Any]]]]],
+        on_result: Callable[[DispatchResult], None] = None,
+        on_wave: Callable[[list[DispatchResult]], None] = None,
+    ) -> DispatchReport:
+        report = DispatchReport()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.perf_counter()
+        halted = False
+
+        async def call(key, func) -> DispatchResult:
+            async with semaphore:
+                result = DispatchResult(key)
+                if self.cancel_requested:
+                    result.cancelled = True
+                else:
+                    call_started = time.perf_counter()
+                    try:
+                        result.response = await func()
+                        result.landed = bool(result.response)
+                    except Exception as e:
+                        result.error = str(e)
+                    result.elapsed = time.perf_counter() - call_started
+                    logging.debug(f"Dispatch {key}: {'landed' if result.landed else 'failed'} in {result.elapsed * 1000:.0f}ms")
+
+                if on_result:
+                    on_result(result)
+                return result
+
+        for wave in waves:
+            if halted or self.cancel_requested:
+                for key, _ in wave:
+                    result = DispatchResult(key, cancelled=True)
+                    report.results.append(result)
+                    if on_result:
+                        on_result(result)
+                continue
+
+            results = await asyncio.gather(*(call(key, func) for key, func in wave))
+            report.results.extend(results)
+            if on_wave:
+                on_wave(results)
+            halted = any(not r.landed and not r.cancelled for r in results)
+
+        report.elapsed = time.perf_counter() - started
+        return report
@@ -1,18 +1,33 @@
 # from __future__ import annotations
 from typing import TYPE_CHECKING
-from collections import OrderedDict
 
 import logging
+import time
 
-from nicegui import ui, app, run
+from nicegui import ui, app
 
 from .api import *
-from .dialogs import confirm_dialog, fix_field_display_order_dialog, launch_field_dialog
-from .helper import get_matters_containing_field
+from .dialogs import confirm_dialog, normalize_display_order_dialog, launch_field_dialog
+from .client import RESULT_CACHE_TTL
+from .commit_queue import CommitQueue
+from .helper import get_matters_containing_fields
+from .indexes import (
+    field_indexes, field_search_index, field_set_search_index, field_set_membership,
+    field_label_text, index_custom_field, sync_field_indexes, sync_field_set_indexes,
+)
+from .reorder import insert_order, plan_normalization, plan_reorder, group_independent_moves
+from .order import FieldOrder
+from .selection import SelectionModel
+from .storage import get_storage
+from .usage import field_usage
+from .sync import (
+    advance_high_water_mark, build_sorted_id_lists, normalize_display_orders, records_by_id,
+    store_custom_fields, store_custom_field_sets,
+)
 logging.basicConfig(level=logging.DEBUG)
     
 def api_input(user, callback) -> ui.input:
-    key_storage = app.storage.general.setdefault('customfield_management_storage', {}).setdefault('clio_api_keys', {})
+    key_storage = get_storage().setdefault('clio_api_keys', {})
     current_user = user
     
     async def copy_token(selected_token):
@@ -42,31 +57,26 @@ def api_input(user, callback) -> ui.input:
         
 async def toggle_deleted_fields(value: bool):
     """Toggle visibility of all deleted custom fields."""
-
-    def get_deleted_custom_field_ids() -> list[str]:
-        """Return a list of custom field IDs where 'deleted' is True."""
-        storage = app.storage.general.get('customfield_management_storage', {})
-        custom_field_data = storage.get('custom_field_data', {})
-
-        return [
-            field_id
-            for field_id, data in custom_field_data.items()
-            if isinstance(data, dict) and data.get('deleted') is True
-        ]
-
-    def toggle_visibility(field_id: str, visible: bool):
-        try:
-            field_card: FieldCard = app.storage.client['fields'].get(int(field_id))
-            if field_card:
-                field_card.set_visibility(visible)
-            # else:
-            #     ui.notify(f'FieldCard not found for ID: {field_id}')
-        except Exception as e:
-            ui.notify(f'Error updating field {field_id}: {e}')
-
-    deleted_fields = get_deleted_custom_field_ids()
-    for field_id in deleted_fields:
-        toggle_visibility(field_id, value)
+    field_container: FieldContainer = app.storage.client.get('field_container')
+    if field_container:
+        field_container.set_show_deleted(value)
+
+def field_rank(field_id) -> tuple:
+    """Position of a field in its parent type's order, unknown fields sort last."""
+    return field_indexes.rank(field_id)
+
+def reorder_children(container: ui.element, cards: dict, id_list: list) -> None:
+    """Put `container`'s cards into `id_list` order, moving only those out of relative order, in one update."""
+    children = container.default_slot.children
+    current = [int(child.clio_id) for child in children if getattr(child, 'clio_id', None) is not None]
+    moves = plan_reorder(current, [int(card_id) for card_id in id_list])
+    if not moves:
+        return
+    for move in moves:
+        card = cards[move.field_id]
+        children.remove(card)
+        children.insert(move.index, card)
+    container.update()
 
 class FieldLabel(ui.label):
     def __init__(self, clio_id) -> None:
@@ -76,7 +86,7 @@ class FieldLabel(ui.label):
         self.deleted: bool = False
         
         self.style('font-size: 1.3em; font-weight: bold; color: #333;')
-        self.data = app.storage.general["customfield_management_storage"]["custom_field_data"][self.clio_id]
+        self.data: dict = {}
         self.refresh()
 
     def update_label(self, name):
@@ -87,10 +97,15 @@ class FieldLabel(ui.label):
         
     def refresh(self):
         try:
-            self.name = self.data.get('name')
-            self.deleted = self.data.get('deleted')
-            label_name = f'{self.name} (Deleted)' if self.deleted else self.name
-            self.set_text(label_name)
+            # Storage may have been replaced by a reload, always read the current record
+            self.data = get_storage()["custom_field_data"][self.clio_id]
+            name = self.data.get('name')
+            deleted = self.data.get('deleted')
+            if self.text and (name, deleted) == (self.name, self.deleted):
+                return
+            self.name = name
+            self.deleted = deleted
+            self.set_text(field_label_text(self.data))
         except Exception:
             self.set_text(f"ERROR{self.clio_id}")
     
@@ -99,22 +114,18 @@ class FieldCard(ui.card):
     def __init__(self, clio_id: str) -> None:
         super().__init__()
         
-        self.field_list: list = app.storage.client.setdefault('field_list', [])
-        self.field_list.append(self)
-
-        self.field_dict: dict = app.storage.client.setdefault('field_dict', {})
-        self.field_dict[clio_id] = self
-        
-        self.selected_fields:list = app.storage.client['selected_fields']
+        self.field_container: FieldContainer = app.storage.client['field_container']
         
         self.clio_id = str(clio_id)
         self.tight().classes('field-card').props('draggable')
+        if self.field_container.virtual:
+            self.classes('virtual-field-card')
         self.last_click = 0
-        self.selected = False
         self.content = None
         self.updating_name=False
         
         self.reload_content()
+        self.apply_selection_style()
         
         self.on('click', self.click)
         self.on('dblclick', self.edit)
@@ -124,6 +135,29 @@ class FieldCard(ui.card):
         # self.on('dragover.prevent', lambda e: ui.notify(e))
         # self.on('dragenter.prevent', lambda e: ui.notify(e))
 
+    @property
+    def field_id(self) -> int:
+        return int(self.clio_id)
+
+    @property
+    def selected(self) -> bool:
+        return self.field_id in self.field_container.selection
+
+    def query_field_ids(self) -> list[int]:
+        """The whole selection when this card is part of it, otherwise just this field."""
+        if self.selected:
+            return list(self.field_container.selection)
+        return [self.field_id]
+
+    def assign(self, clio_id) -> None:
+        """Recycle this card for another field (windowed mode)."""
+        self.clio_id = str(clio_id)
+        self.updating_name = False
+        self.content.clio_id = self.clio_id
+        self.content.refresh()
+        self.update_usage()
+        self.apply_selection_style()
+
     def get_parent(self):
         field_container:FieldContainer = app.storage.client.get('field_container')
         field_container.move_selected_cards(self.clio_id, position="before")
@@ -132,6 +166,9 @@ class FieldCard(ui.card):
         self.clear()
         with self:
             self.content = FieldLabel(self.clio_id)
+            with ui.badge().props('outline').classes('usage-badge') as self.usage_badge:
+                self.usage_tooltip = ui.tooltip()
+            self.update_usage()
             duplicate_menu = None
             with ui.context_menu().props('auto-close'):
 
@@ -142,13 +179,13 @@ class FieldCard(ui.card):
                 # Only show these when less than two field is selected
                 duplicate_menu = ui.menu_item("Duplicate") \
                     .bind_visibility_from(
-                        app.storage.client,
-                        'selected_fields',
-                        backward=lambda v: (len(v) == 1 and self.selected) or (len(v) == 0 and not self.selected)
+                        self.field_container.selection,
+                        'count',
+                        backward=lambda v: (v == 1 and self.selected) or (v == 0 and not self.selected)
                         )
                 
                 duplicate_menu.on('click', self.duplicate_field)
-                ui.menu_item('Get Containing matters', on_click= lambda: get_matters_containing_field(self.clio_id))
+                ui.menu_item('Get Containing matters', on_click= lambda: get_matters_containing_fields(self.query_field_ids()))
                 # ui.menu_item("Copy", on_click=lambda: ui.notify(self.to_dict())) \
                 #     .bind_visibility_from(self.event_handler, 'fields_selected_count', backward=lambda v: (v == 1 and self.selected) or (v == 0 and not self.selected)
                 #     )
@@ -161,7 +198,7 @@ class FieldCard(ui.card):
                            
     async def edit(self):
         try:
-            kwargs = app.storage.general['customfield_management_storage']["custom_field_data"][self.clio_id]
+            kwargs = dict(get_storage()["custom_field_data"][self.clio_id])
             kwargs['id'] = self.clio_id
 
             await launch_field_dialog(method='patch', **kwargs)
@@ -177,17 +214,20 @@ class FieldCard(ui.card):
         
     def refresh(self):
         self.content.refresh()
+        self.update_usage()
+
+    def update_usage(self) -> None:
+        """Badge with the number of matters using this field, once a usage analysis has run."""
+        api_client = app.storage.tab.get('custom_field_management_api')
+        usage = field_usage(self.clio_id, api_client.access_token) if api_client and self.field_container.parent_type == 'matter' else None
+        self.usage_badge.set_visibility(usage is not None)
+        if usage is None:
+            return
+        self.usage_badge.set_text(str(usage['matters']) if usage['matters'] else 'Unused')
+        self.usage_badge.props(f"color={'primary' if usage['values'] else 'negative'}")
+        last_used = (usage['last_used'] or '')[:10] or 'never'
+        self.usage_tooltip.set_text(f"{usage['matters']} matters, {usage['values']} with a value, last used {last_used}")
 
-    def update_visibility(self, search_text):
-        if search_text not in self.content.text.lower():
-            self.set_visibility(False)
-            
-        if search_text in self.content.text.lower() and not self.visible:
-            self.set_visibility(True)
-            
-        if search_text == "" and not self.visible:
-            self.set_visibility(True)
-            
     async def click(self, e):
         app.storage.client['last_clicked'] = self
         
@@ -199,26 +239,13 @@ class FieldCard(ui.card):
         ctrl_pressed = e.args.get('ctrlKey')
         click_type = e.args.get('type')
 
+        selection = self.field_container.selection
         if not any([ctrl_pressed, shift_pressed, alt_pressed]):
-            selected_fields = self.selected_fields.copy()
-            for field in selected_fields:
-                field.deselect()
-
-        if shift_pressed and self.selected_fields:
-            try:
-                current_index = self.field_list.index(self)
-                last_selected = self.selected_fields[-1]
-                last_index = self.field_list.index(last_selected)
-
-                start = min(current_index, last_index)
-                end = max(current_index, last_index)
-
-                for i in range(start, end + 1):
-                    if self.field_list[i].visible:
-                        self.field_list[i].select()
-            except ValueError:
-                # Safety fallback if items are missing
-                self.select()
+            selection.clear()
+
+        if shift_pressed and selection.anchor is not None:
+            # Range over the logical (filtered) order, not just the rendered cards
+            selection.select_range(selection.anchor, self.field_id)
         else:
             if self.selected:
                 self.deselect()
@@ -227,22 +254,20 @@ class FieldCard(ui.card):
                 
     def select(self):
         """Select this card and update its background color."""
-        self.selected_fields.append(self)
-        self.selected = True
-        self.style('background-color: lightblue;')
+        self.field_container.selection.select([self.field_id])
         
     def deselect(self):
         """Deselect this card and remove highlight."""
-        self.selected = False
-        self.style('background-color: white;')  # Remove highlight
+        self.field_container.selection.deselect([self.field_id])
         if time.time() > self.last_click + .2:
             self.updating_name= False
             self.reload_content()
-        if self in self.selected_fields:
-            self.selected_fields.remove(self)
+
+    def apply_selection_style(self):
+        self.style('background-color: lightblue;' if self.selected else 'background-color: white;')
 
     async def duplicate_field(self):
-        data = app.storage.general["customfield_management_storage"]["custom_field_data"][self.clio_id].copy()
+        data = get_storage()["custom_field_data"][self.clio_id].copy()
         data['display_order'] += 1
         with self:
             await launch_field_dialog(method='duplicate', **data)
@@ -269,7 +294,7 @@ class FieldSetCard(ui.card):
 
     def load(self):
         """Generate field labels once and store their elements."""
-        storage = app.storage.general.get('customfield_management_storage', {})
+        storage = get_storage()
         self.field_set_data = storage.get('custom_field_set_data', {}).get(self.clio_id, {})
         self.field_data_lookup = storage.get('custom_field_data', {})
 
@@ -281,11 +306,8 @@ class FieldSetCard(ui.card):
 
         custom_fields = self.field_set_data.get('custom_fields', [])
 
-        # Sort by display_order at creation time
-        sorted_fields = sorted(
-            custom_fields,
-            key=lambda f: self.field_data_lookup.get(str(f['id']), {}).get('display_order', float('inf'))
-        )
+        # Sort by field order at creation time
+        sorted_fields = sorted(custom_fields, key=lambda f: field_rank(f['id']))
 
         with self.card_table:
             for index, field in enumerate(sorted_fields):
@@ -294,45 +316,95 @@ class FieldSetCard(ui.card):
                 field_name = field_info.get('name', f"Field {field_id}")
 
                 label = ui.label(field_name).classes('field-label')
+                label.clio_id = str(field_id)
 
                 self.field_labels[field_id] = label
 
-    def refresh(self):
-        """Reorder existing field labels based on updated display_order."""
-        storage = app.storage.general.get('customfield_management_storage', {})
-        field_data = storage.get('custom_field_data', {})
-
-        # Sort field IDs by new display_order
-        sorted_field_ids = sorted(
-            self.field_labels.keys(),
-            key=lambda fid: field_data.get(str(fid), {}).get('display_order', float('inf'))
-        )
+    def update_from_storage(self) -> None:
+        """Apply a reload: rebuild labels if membership changed, otherwise only rename and reorder."""
+        storage = get_storage()
+        field_set_data = storage.get('custom_field_set_data', {}).get(self.clio_id, {})
+        self.field_data_lookup = storage.get('custom_field_data', {})
+
+        old_ids = {int(field['id']) for field in self.field_set_data.get('custom_fields', [])}
+        new_ids = {int(field['id']) for field in field_set_data.get('custom_fields', [])}
+        if old_ids != new_ids:
+            self.card_table.clear()
+            self.field_labels = {}
+            self.load()
+            return
+
+        self.field_set_data = field_set_data
+        self.title.set_text(field_set_data.get('name', f"Field Set {self.clio_id}"))
+        for field_id, label in self.field_labels.items():
+            label.set_text(self.field_data_lookup.get(str(field_id), {}).get('name', f"Field {field_id}"))
+        self.refresh()
 
-        # Move UI elements in-place
-        for index, fid in enumerate(sorted_field_ids):
-            label = self.field_labels.get(fid)
-            if label:
-                print(f"Moving Label: {label.text}")
-                label.move(target_index=index)
+    def refresh(self):
+        """Reorder the field labels by the shared field rank, touching only labels out of order."""
+        reorder_children(self.card_table, self.field_labels, sorted(self.field_labels, key=field_rank))
 
 class FieldSetContainer(ui.column):
     def __init__(self, parent_type: str = 'matter'):
         super().__init__()
         self.style('width: 100%; gap: 1rem;')  # Full width with spacing between cards
         self.parent_type = parent_type.lower()
+        self.filter_text = ''
+        self.loaded = False
+        sync_field_set_indexes()
 
         # self.load()
 
     def refresh(self):
-        """Clear and reload the field set cards."""
-        self.clear()
+        """Reconcile the field set cards with storage by Clio id."""
+        try:
+            field_set_ids = get_storage()[self.parent_type.lower()]['custom_field_set_id_list']
+        except Exception as e:
+            ui.notify(f"❌ Failed to load field sets: {e}", color='red')
+            return
+
+        field_set_cards: dict = app.storage.client['field_set_cards']
+        wanted = set(field_set_ids)
+
+        for set_id in [set_id for set_id in field_set_cards if set_id not in wanted]:
+            card = field_set_cards.pop(set_id)
+            if card.parent_slot is not None:
+                self.remove(card)
 
         with self:
-            self.load()
+            for set_id in field_set_ids:
+                card = field_set_cards.get(set_id)
+                if card is None:
+                    field_set_cards[set_id] = FieldSetCard(str(set_id))
+                else:
+                    card.update_from_storage()
+
+        reorder_children(self, field_set_cards, field_set_ids)
+        self.apply_visibility()
+
+    def set_filter(self, search_text: str) -> None:
+        self.filter_text = (search_text or '').strip().lower()
+        self.apply_visibility()
+
+    def apply_visibility(self) -> None:
+        """Show sets whose name, or one of whose fields' names, matches the filter."""
+        field_set_cards: dict = app.storage.client['field_set_cards']
+        matched = None
+        if self.filter_text:
+            field_ids = field_search_index.matches(self.filter_text)
+            matched = field_set_search_index.matches(self.filter_text)
+            if not matched and not field_ids:
+                # Nothing contains the text, fall back to close (typo-tolerant) matches
+                field_ids = set(field_search_index.search(self.filter_text, limit=50))
+                matched = set(field_set_search_index.search(self.filter_text, limit=50))
+            matched |= {set_id for field_id in field_ids for set_id in field_set_membership.sets_containing(field_id)}
+
+        for set_id, card in field_set_cards.items():
+            card.set_visibility(matched is None or int(set_id) in matched)
 
     def load(self):
         try:
-            field_set_ids = app.storage.general['customfield_management_storage'][self.parent_type.lower()]['custom_field_set_id_list']
+            field_set_ids = get_storage()[self.parent_type.lower()]['custom_field_set_id_list']
 
             for id in field_set_ids:
                 app.storage.client['field_set_cards'][id] = FieldSetCard(str(id))
@@ -340,89 +412,251 @@ class FieldSetContainer(ui.column):
         except Exception as e:
             ui.notify(f"❌ Failed to load field sets: {e}", color='red')
                 
-    async def load_from_api(self):
-        client = app.storage.tab['custom_field_management_api']
-        response = await run.io_bound(get_custom_field_sets, client, self.parent_type)
+    async def load_from_api(self, api_client = None, force: bool = False):
+        client = api_client or app.storage.tab['custom_field_management_api']
+        # A forced load must not be answered from the short-lived shared result cache
+        response = await get_custom_field_sets_async(client, self.parent_type, max_age=0 if force else RESULT_CACHE_TTL)
+        if not response:
+            ui.notify("❌ Failed to load field sets", color='red')
+            return
         data = response.get('data', [])
+        if not response.get('modified', True) and self.loaded and not force:
+            logging.debug(f"Custom field sets for {self.parent_type} not modified")
+            advance_high_water_mark(self.parent_type, 'custom_field_sets', data)
+            return
 
-        def transform_to_dict(data: list[dict]) -> dict[str, dict]:
-            """Convert list of dicts into a dict using 'id' (as str) as key."""
-            return {str(item['id']): {k: v for k, v in item.items() if k != 'id'} for item in data}
-
-        def split_ids_by_parent_type(data: list[dict]) -> dict[str, list[int]]:
-            from collections import defaultdict
-
-            parent_groups: dict[str, list[tuple[str, int]]] = defaultdict(list)
-            for item in data:
-                parent_type = item.get('parent_type', 'Matter')
-                name = item.get('name', '')
-                parent_groups[parent_type].append((name.lower(), item['id']))
-
-            return {
-                parent: [fid for name, fid in sorted(items)]
-                for parent, items in parent_groups.items()
-            }
-
-        def build_custom_field_map(data: list[dict]) -> dict[int, list[int]]:
-            field_map: dict[int, list[int]] = {}
-            for field_set in data:
-                field_set_id = field_set['id']
-                for cf in field_set.get('custom_fields', []):
-                    field_map.setdefault(cf['id'], []).append(field_set_id)
-            return field_map
-
-        def build_custom_field_set_map(data: list[dict]) -> dict[int, list[int]]:
-            set_map: dict[int, list[int]] = {}
-            for field_set in data:
-                field_set_id = field_set['id']
-                custom_field_ids = [cf['id'] for cf in field_set.get('custom_fields', []) if 'id' in cf]
-                set_map[field_set_id] = custom_field_ids
-            return set_map
-
-        def store_results(
-            dict_data: dict,
-            id_lists: dict[str, list[int]],
-            field_map: dict[int, list[int]],
-            field_set_map: dict[int, list[int]]
-        ) -> None:
-            storage = app.storage.general.get('customfield_management_storage')
-            storage['custom_field_set_data'] = dict_data
-            storage['custom_field_map'] = field_map
-            storage['custom_field_set_map'] = field_set_map
-            for parent_type, ids in id_lists.items():
-                section = storage.get(parent_type.lower())
-                section['custom_field_set_id_list'] = ids  # already sorted
-
-        custom_field_set_dict = transform_to_dict(data)
-        id_lists_by_type = split_ids_by_parent_type(data)
-        custom_field_map = build_custom_field_map(data)
-        custom_field_set_map = build_custom_field_set_map(data)
-
-        store_results(
-            custom_field_set_dict,
-            id_lists_by_type,
-            custom_field_map,
-            custom_field_set_map
-        )
+        store_custom_field_sets(self.parent_type, data)
 
+        self.loaded = True
         self.refresh()
         
 class FieldContainer(ui.column):
 
-    def __init__(self, parent_type: str = None, global_storage=None):
+    # Windowed mode turns on automatically above this many fields
+    VIRTUAL_THRESHOLD = 500
+    # Fixed card height and column gap in windowed mode (px), see .virtual-field-card
+    ROW_HEIGHT = 34
+    ROW_GAP = 2
+    # Cards rendered above and below the viewport
+    OVERSCAN = 10
+    # Fetches a full load makes before giving up to local changes that keep landing
+    LOAD_ATTEMPTS = 3
+
+    def __init__(self, parent_type: str = None, global_storage=None, scroll_area: ui.scroll_area = None):
         super().__init__()  # ✅ correct super call
         self.parent_type = parent_type
         self.classes('scroll-content')
         app.storage.client['field_container'] = self
         self.global_storage = global_storage
 
+        sync_field_indexes()
+
+        # Single source of the field order; the persisted id list and display_orders derive from it
+        self.order = FieldOrder(self.global_storage[self.parent_type]["custom_field_id_list"])
+
+        # Selection is kept by field id so it covers fields that are filtered out or not rendered
+        self.selection = SelectionModel(on_change=self.restyle)
+        self.filter_text = ''
+        self.show_deleted = True
+        self.visible_ids: list[int] = []
+        self.visible_set: set[int] = set()
+        # Card element id -> [label, deleted] last sent to the browser filter
+        self.filter_entries: dict[int, list] = {}
+
+        # Set once this container has applied a load, a later 304 has nothing to apply
+        self.loaded = False
+        # Set when the user cancelled (or Clio did not take) a display_order normalization,
+        # background loads then leave it to the user instead of asking again every sync
+        self.normalization_declined = False
+
+        # None follows VIRTUAL_THRESHOLD, a bool is the user's choice
+        self.virtual_setting: bool = app.storage.user.get('customfield_virtual_scroll')
+        self.virtual = False
+        self.scroll_position = 0
+        self.viewport_height = 900
+        self.window_start = 0
+
+        if scroll_area:
+            scroll_area.on('scroll', self.handle_scroll, args=['verticalPosition', 'verticalContainerSize'], throttle=0.05)
+
+    def restyle(self, field_ids) -> None:
+        field_cards: dict = app.storage.client['fields']
+        for field_id in field_ids:
+            card: FieldCard = field_cards.get(field_id)
+            if card:
+                card.apply_selection_style()
+
+    # Filtering
+
+    def matches(self, field_id: int, matched: set = None, hidden: set = ()) -> bool:
+        if matched is not None and field_id not in matched:
+            return False
+        return str(field_id) not in hidden
+
+    def update_visible_ids(self) -> None:
+        matched = field_search_index.matches(self.filter_text) if self.filter_text else None
+        hidden = () if self.show_deleted else field_indexes.deleted_ids(self.parent_type)
+        self.visible_ids = [field_id for field_id in self.order if self.matches(field_id, matched, hidden)]
+        self.visible_set = set(self.visible_ids)
+        self.selection.set_visible_order(self.visible_ids)
+
+    def apply_visibility(self) -> None:
+        self.update_visible_ids()
+        if self.virtual:
+            self.render_window()
+            return
+
+        # Cards are hidden in the browser (see scripts.py), it only needs the labels that changed
+        self.push_filter_entries()
+
+    def push_filter_entries(self) -> None:
+        field_data = get_storage()['custom_field_data']
+        entries = {}
+        for field_id, card in app.storage.client['fields'].items():
+            data = field_data.get(str(field_id), {})
+            entries[card.id] = [(field_label_text(data) or '').lower(), bool(data.get('deleted'))]
+
+        changed = {card_id: entry for card_id, entry in entries.items() if self.filter_entries.get(card_id) != entry}
+        removed = [card_id for card_id in self.filter_entries if card_id not in entries]
+        self.filter_entries = entries
+        if changed or removed:
+            self.client.run_javascript(f'customFieldFilter.update({json.dumps(changed)}, {json.dumps(removed)})')
+
+    def set_filter(self, search_text: str) -> None:
+        """Called once typing pauses; the browser has already filtered the rendered cards."""
+        self.filter_text = search_text.strip().lower()
+        if self.virtual:
+            self.apply_visibility()
+        else:
+            self.update_visible_ids()
+
+    def set_show_deleted(self, value: bool) -> None:
+        self.show_deleted = value
+        if self.virtual:
+            self.apply_visibility()
+        else:
+            self.update_visible_ids()
+            self.client.run_javascript(f'customFieldFilter.setShowDeleted({json.dumps(value)})')
+
+    # Rendering
+
+    def set_virtual(self, value: bool) -> None:
+        """Switch between one card per field and a recycled window of cards."""
+        self.virtual_setting = value
+        app.storage.user['customfield_virtual_scroll'] = value
+        self.refresh()
+
+    def set_order(self, id_list: list[int]) -> None:
+        """Replace the field order (after a load) and persist the derived id list."""
+        self.order = FieldOrder(id_list)
+        self.persist_order()
+
+    def persist_order(self) -> None:
+        self.global_storage[self.parent_type]["custom_field_id_list"] = self.order.to_list()
+
     def refresh(self):
-        self.clear()
+        """Reconcile the field cards with storage by Clio id, touching only what changed."""
+        id_list = self.order.to_list()
+        self.selection.retain(set(id_list))
+        virtual = self.virtual_setting if self.virtual_setting is not None else len(id_list) > self.VIRTUAL_THRESHOLD
+
+        if virtual != self.virtual:
+            self.clear()
+            app.storage.client['fields'].clear()
+            self.virtual = virtual
+            self.filter_entries = {}
+            self.client.run_javascript('customFieldFilter.reset({})')
+            if not virtual:
+                self.style(remove='padding-top: 0; padding-bottom: 0')
+
+        if self.virtual:
+            self.apply_visibility()
+            return
+
+        field_cards: dict = app.storage.client['fields']
+        wanted = set(id_list)
+
+        for field_id in [field_id for field_id in field_cards if field_id not in wanted]:
+            self.remove_card(field_cards.pop(field_id))
+
         with self:
-            for id in self.global_storage[self.parent_type]["custom_field_id_list"]:
-                app.storage.client['fields'][id] = FieldCard(clio_id=id)
-        
-    async def load_from_api(self, api_client = None):
+            for field_id in id_list:
+                card = field_cards.get(field_id)
+                if card is None:
+                    field_cards[field_id] = FieldCard(clio_id=field_id)
+                else:
+                    card.refresh()
+
+        reorder_children(self, field_cards, id_list)
+        self.apply_visibility()
+
+    def update_cards(self, field_ids) -> None:
+        """Push merged records to their cards only, falling back to refresh() for new ones."""
+        field_cards: dict = app.storage.client['fields']
+        if not self.virtual and any(field_id not in field_cards for field_id in field_ids):
+            self.refresh()
+            return
+
+        for field_id in field_ids:
+            card = field_cards.get(field_id)
+            if card:
+                card.refresh()
+        self.apply_visibility()
+
+    def show_usage(self) -> None:
+        for card in app.storage.client['fields'].values():
+            card.update_usage()
+
+    def remove_card(self, card: 'FieldCard') -> None:
+        if app.storage.client.get('last_clicked') is card:
+            app.storage.client['last_clicked'] = None
+        if card.parent_slot is not None:
+            self.remove(card)
+
+    def handle_scroll(self, e) -> None:
+        self.scroll_position = e.args.get('verticalPosition', 0)
+        self.viewport_height = e.args.get('verticalContainerSize') or self.viewport_height
+        if self.virtual and self.window_bounds()[0] != self.window_start:
+            self.render_window()
+
+    def window_bounds(self) -> tuple[int, int]:
+        pitch = self.ROW_HEIGHT + self.ROW_GAP
+        start = max(0, int(self.scroll_position // pitch) - self.OVERSCAN)
+        count = int(self.viewport_height // pitch) + 2 * self.OVERSCAN + 1
+        return start, min(len(self.visible_ids), start + count)
+
+    def render_window(self) -> None:
+        """Materialize cards only for visible fields near the viewport, recycling the rest."""
+        start, end = self.window_bounds()
+        start = min(start, end)
+        window_ids = self.visible_ids[start:end]
+        window = set(window_ids)
+        self.window_start = start
+
+        field_cards: dict = app.storage.client['fields']
+        spare = [field_cards.pop(field_id) for field_id in [field_id for field_id in field_cards if field_id not in window]]
+
+        with self:
+            for field_id in window_ids:
+                if field_id in field_cards:
+                    field_cards[field_id].refresh()
+                elif spare:
+                    card = spare.pop()
+                    card.assign(field_id)
+                    field_cards[field_id] = card
+                else:
+                    field_cards[field_id] = FieldCard(clio_id=field_id)
+
+        for card in spare:
+            self.remove_card(card)
+
+        reorder_children(self, field_cards, window_ids)
+
+        # Padding stands in for the rows outside the window so the scrollbar keeps its size
+        pitch = self.ROW_HEIGHT + self.ROW_GAP
+        self.style(f'padding-top: {start * pitch}px; padding-bottom: {(len(self.visible_ids) - end) * pitch}px;')
+
+    async def load_from_api(self, api_client = None, force: bool = False, background: bool = False):
         if not api_client:
             api_client = app.storage.tab.get('custom_field_management_api')
         
@@ -430,159 +664,190 @@ class FieldContainer(ui.column):
             ui.notify('No client started')
             return
 
-        response = await run.io_bound(get_custom_fields, api_client, self.parent_type)
+        commit_queue: CommitQueue = app.storage.client.get('commit_queue')
+        for attempt in range(self.LOAD_ATTEMPTS):
+            # A listing fetched while optimistic moves are in flight would revert them
+            if commit_queue:
+                await commit_queue.idle.wait()
+            generation = commit_queue.generation if commit_queue else 0
+
+            response = await get_custom_fields_async(api_client, self.parent_type, max_age=0 if force or attempt else RESULT_CACHE_TTL)
+            if not response:
+                ui.notify("❌ Failed to load custom fields", color='red')
+                return
+            if not (commit_queue and commit_queue.changed_since(generation)):
+                break
+            logging.debug(f"Fields of {self.parent_type} changed locally during the load, fetching again")
+        else:
+            logging.debug(f"Gave up loading fields of {self.parent_type}, local changes kept landing")
+            return
         data = response.get('data', [])
+        if not response.get('modified', True) and self.loaded and not force:
+            # Every page came back 304, storage and cards already match
+            logging.debug(f"Custom fields for {self.parent_type} not modified")
+            advance_high_water_mark(self.parent_type, 'custom_fields', data)
+            return
 
-        def build_data_map(items: list[dict]) -> OrderedDict:
-            result = OrderedDict()
-            for item in items:
-                item_id = str(item['id'])  # to match your example structure
-                item_copy = item.copy()
-                del item_copy['id']
-                result[item_id] = item_copy
-            return result
-
-        def build_sorted_id_lists(items: list[dict]) -> tuple[dict[str, list[int]], bool]:
-            from collections import defaultdict
-
-            sorted_ids = defaultdict(list)
-            inconsistencies_found = False
+        custom_field_id_lists, has_inconsistencies = build_sorted_id_lists(data)
+        if has_inconsistencies:
+            if background and self.normalization_declined:
+                logging.debug(f"Display orders of {self.parent_type} fields still not sequential, normalization was declined")
+                return
+            await self.normalize_display_order(data, api_client)
+            return
 
-            grouped = defaultdict(list)
-            for item in items:
-                grouped[item['parent_type'].lower()].append((item['display_order'], item['id']))
+        with get_storage().transaction():
+            store_custom_fields(self.parent_type, data, custom_field_id_lists)
+            self.set_order(custom_field_id_lists.get(self.parent_type, []))
 
-            for parent_type, pairs in grouped.items():
-                seen_orders = set()
-                display_orders = []
+        self.loaded = True
+        self.refresh()
 
-                for order, item_id in pairs:
-                    if order in seen_orders:
-                        inconsistencies_found = True
-                    seen_orders.add(order)
-                    display_orders.append(order)
+    async def stream_from_api(self, api_client = None, on_page = None):
+        """
+        Full load that draws each Clio page as it arrives instead of after the last one.
 
-                sorted_ids[parent_type] = [item_id for _, item_id in sorted(pairs)]
+        Pages come in display_order, so every page is merged into storage and appended to
+        the order; records Clio no longer returns are dropped only once the walk completed.
+        """
+        if not api_client:
+            api_client = app.storage.tab.get('custom_field_management_api')
 
-                if display_orders:
-                    min_order = min(display_orders)
-                    max_order = max(display_orders)
-                    expected = set(range(min_order, max_order + 1))
-                    if expected != seen_orders:
-                        inconsistencies_found = True
+        if not api_client:
+            ui.notify('No client started')
+            return
 
-            return dict(sorted_ids), inconsistencies_found
+        data = []
+        storage = get_storage()
+        commit_queue: CommitQueue = app.storage.client.get('commit_queue')
+        generation = commit_queue.generation if commit_queue else 0
+        try:
+            async for page in iter_custom_fields_async(api_client, self.parent_type):
+                if commit_queue and commit_queue.changed_since(generation):
+                    # Pages from before the user's moves would undo them, reload once they are sent
+                    logging.debug(f"Fields of {self.parent_type} changed locally during the stream, reloading")
+                    await self.load_from_api(api_client, force=True)
+                    return
+                with storage.transaction():
+                    field_data = storage['custom_field_data']
+                    for field_id, record in records_by_id(page).items():
+                        field_data[field_id] = record
+                        index_custom_field(field_id, record)
+                    # The list can shift while it is paged, an id may come back on a later page
+                    page_ids = list(dict.fromkeys(item['id'] for item in page))
+                    if data:
+                        self.order.extend(field_id for field_id in page_ids if field_id not in self.order)
+                        self.persist_order()
+                    else:
+                        self.set_order(page_ids)
+                data.extend(page)
+                self.refresh()
+                if on_page:
+                    on_page()
+        except Exception as e:
+            logging.debug(f"An error occurred: {e}")
+            ui.notify("❌ Failed to load custom fields", color='red')
+            return
 
-        storage = app.storage.general.setdefault('customfield_management_storage', {})
+        if commit_queue and commit_queue.changed_since(generation):
+            await self.load_from_api(api_client, force=True)
+            return
 
+        # A repeated field counts once, with the record from its last page
+        data = list({item['id']: item for item in data}.values())
         custom_field_id_lists, has_inconsistencies = build_sorted_id_lists(data)
         if has_inconsistencies:
-            reload = await fix_field_display_order_dialog(parent_type=self.parent_type)
-            if reload:
-                await self.load_from_api()
+            await self.normalize_display_order(data, api_client)
             return
-    
-            
-        for parent_type, id_list in custom_field_id_lists.items():
-            storage.setdefault(parent_type, {})['custom_field_id_list'] = id_list
 
-        custom_field_data = build_data_map(data)
-        storage['custom_field_data'] = custom_field_data
-        
+        with storage.transaction():
+            store_custom_fields(self.parent_type, data, custom_field_id_lists)
+            self.set_order(custom_field_id_lists.get(self.parent_type, []))
+
+        self.loaded = True
         self.refresh()
 
+    async def normalize_display_order(self, data: list[dict], api_client = None) -> None:
+        """Renumber gapped or duplicated display_orders in Clio (after a preview unless automatic), then reload."""
+        moves = plan_normalization({item['id']: item['display_order'] for item in data if item['parent_type'].lower() == self.parent_type})
+        if not app.storage.user.get('customfield_auto_normalize'):
+            if not await normalize_display_order_dialog(self.parent_type, len(moves), len(data)):
+                self.normalization_declined = True
+                return
+
+        ui.notify(f'Normalizing {len(moves)} display orders...')
+        report, verified = await normalize_display_orders(self.parent_type, moves, api_client)
+        if not verified:
+            self.normalization_declined = True
+            ui.notify(f"❌ Display orders still not sequential after {len(report.landed)} updates", color='red')
+            return
+
+        self.normalization_declined = False
+        ui.notify('Display orders normalized', type='positive')
+        await self.load_from_api(api_client, force=True)
+
     def move_selected_cards(self, target_id: str, position: str) -> None:
 
-        selected_cards = app.storage.client.get('selected_fields', [])
-        if not selected_cards:
+        moving_ids = list(self.selection)
+        if not moving_ids:
             ui.notify("No cards selected!", color="red")
             return
-        
-        card_lookup = {card.clio_id: card for card in selected_cards}
-        moving_ids = [card.clio_id for card in selected_cards]
-
-        # Sort selected IDs by display_order
-        field_data = app.storage.general['customfield_management_storage']['custom_field_data']
-        sorted_ids = sorted(
-            moving_ids,
-            key=lambda fid: field_data.get(fid, {}).get('display_order', float('inf'))
-        )
 
-        field_order_list: list[int] = self.global_storage.get(self.parent_type.lower(), {}) \
-            .get("custom_field_id_list", []).copy()
+        field_data = get_storage()['custom_field_data']
 
-        try:
-            target_index = field_order_list.index(int(target_id))
-        except ValueError:
+        target_id = int(target_id)
+        if target_id not in self.order:
             ui.notify(f"Target ID {target_id} not found.", color="red")
             return
 
-        moved_so_far: list[int] = []
-
-        for i, fid in enumerate(sorted_ids):
-            fid_int = int(fid)
-
-            # Determine insert index
-            if not moved_so_far:
-                if position == "before":
-                    insert_index = max(target_index, 0)
-                elif position == "after":
-                    insert_index = target_index + 1
-                else:
-                    insert_index = target_index
-            else:
-                last_inserted = moved_so_far[-1]
-                insert_index = field_order_list.index(last_inserted) + 1
-
-            # Locate current position before mutation
-            try:
-                current_index = field_order_list.index(fid_int)
-            except ValueError:
-                ui.notify(f"Field ID {fid_int} not found in current list.", color="red")
-                continue
-
-            # Always pop before insert, regardless of direction
-            field_order_list.pop(current_index)
-            adjusted_index = insert_index - 1 if current_index < insert_index else insert_index
-            field_order_list.insert(adjusted_index, fid_int)
-
-            # Call API and move UI only if API call succeeded
-            if update_custom_field_display_order(fid_int, adjusted_index):
-                if fid in card_lookup:
-                    card_lookup[fid].move(target_index=adjusted_index)
-                moved_so_far.append(fid_int)
-            else:
-                print(f"Move for {fid} failed — reverting insert")
-                field_order_list.pop(adjusted_index)
-                field_order_list.insert(current_index, fid_int)  # revert change
-
-        # Final step: persist new order
-        self.global_storage[self.parent_type.lower()]["custom_field_id_list"] = field_order_list
-
-        # Update target_id's display_order in storage
-        try:
-            new_target_index = field_order_list.index(int(target_id))
-            target_id_str = str(target_id)
-            if target_id_str in field_data:
-                field_data[target_id_str]['display_order'] = new_target_index
-            else:
-                logging.debug(f"Target ID {target_id} not found in custom_field_data")
-        except ValueError:
-            logging.debug(f"Target ID {target_id} missing from final field_order_list")
-            
-        # Refresh all affected cards
-        affected_ids = moved_so_far + [int(target_id)]
-        refreshed_card_ids = set()
+        # Plan the fewest display_order PATCHes that group the selection at the target
+        current_order = self.order.to_list()
+        desired_order = insert_order(current_order, moving_ids, target_id, position)
+        moves = plan_reorder(current_order, desired_order)
+        if not moves:
+            ui.notify("Fields are already in that order")
+            return
+        waves = group_independent_moves(current_order, moves)
+        field_cards = app.storage.client['fields']
+
+        # Apply the whole plan to the order, DOM and storage now, the API catches up in the background
+        low, high = len(current_order), 0
+        for move in moves:
+            old_index = self.order.move(move.field_id, move.index)
+            low, high = min(low, old_index, move.index), max(high, old_index, move.index)
+            if not self.virtual and move.field_id in field_cards:
+                field_cards[move.field_id].move(target_index=move.index)
+
+        # One storage write for every shifted record and the id list
+        with get_storage().transaction():
+            for index, field_id in enumerate(self.order.slice(low, high + 1), start=low):
+                shifted = field_data.get(str(field_id))
+                if isinstance(shifted, dict):
+                    shifted['display_order'] = index
+                    index_custom_field(field_id, shifted)
+
+            self.persist_order()
+        if self.virtual:
+            self.apply_visibility()
+        else:
+            self.update_visible_ids()
+
+        # The queue sends from background tasks without the tab's context, resolve the client here
+        client = resolve_async_client(app.storage.tab['custom_field_management_api'])
+        commit_queue: CommitQueue = app.storage.client['commit_queue']
+        commit_queue.submit(
+            f'Move {len(moving_ids)} fields',
+            [[(move.field_id, lambda move=move: update_custom_field_display_order_async(move.field_id, move.index, client, store=False)) for move in wave] for wave in waves],
+            labels={move.field_id: field_data.get(str(move.field_id), {}).get('name', move.field_id) for move in moves},
+            on_wave=store_display_order_results,
+        )
 
-        for field_id in affected_ids:
-            field_set_ids = app.storage.general['customfield_management_storage']['custom_field_map'].get(field_id, [])
-            for set_id in field_set_ids:
-                if set_id in refreshed_card_ids:
-                    continue
-                field_set_card: FieldSetCard = app.storage.client['field_set_cards'].get(set_id)
-                if field_set_card:
-                    field_set_card.refresh()
-                    refreshed_card_ids.add(set_id)
+        # Only moved fields change their order relative to the rest of a set
+        field_set_cards: dict = app.storage.client['field_set_cards']
+        for set_id in set().union(*(field_set_membership.sets_containing(move.field_id) for move in moves)):
+            field_set_card: FieldSetCard = field_set_cards.get(set_id)
+            if field_set_card:
+                field_set_card.refresh()
             
     async def delete_custom_fields(self):
         names = []
@@ -14,10 +14,14 @@ async def handle_key_event(e: KeyEventArguments):
             await last_clicked.edit()
 
         elif last_clicked and e.key.name == 'Escape':
-            selected_field: list[FieldCard] = app.storage.client['selected_fields'].copy()
-            for field in selected_field:
-                field.deselect()
-            last_clicked = None  # this line should be outside the for-loop if you want it set only once
+            app.storage.client['field_container'].selection.clear()
+            last_clicked = None
+
+        elif e.modifiers.ctrl and e.key.name == 'a':
+            app.storage.client['field_container'].selection.select_all()
+
+        elif e.modifiers.ctrl and e.key.name == 'i':
+            app.storage.client['field_container'].selection.invert()
 
         elif e.modifiers.ctrl and e.key.name == 'n':
             await launch_field_dialog(method="post")
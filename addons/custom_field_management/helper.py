@@ -1,36 +1,166 @@
 
-from nicegui import ui, app
+from nicegui import ui, run
+import asyncio
+import csv
+import io
 import logging
+import time
+from collections import OrderedDict
+
+from .api import resolve_async_client
+from .indexes import field_indexes
+from .storage import get_storage
+from .usage import get_usage_index
+
+# Completed "containing matters" lookups are reused for this long (s), for at most this many fields
+MATTER_QUERY_TTL = 300
+MATTER_QUERY_CACHE_SIZE = 32
+MATTER_QUERY_FIELDS = "id,display_number,description"
+MATTERS_PER_PAGE = 25
 
 def get_deleted_custom_field_ids(parent_type) -> list[str]:
     """Return a list of custom field IDs where 'deleted' is True."""
-    storage = app.storage.general.get('customfield_management_storage', {})
-    custom_field_data = storage.get('custom_field_data', {})
-
-    deleted_fields = [
-        field_id
-        for field_id, data in custom_field_data.items()
-        if isinstance(data, dict) and data.get('deleted') is True and data.get("parent_type") == parent_type.title()
-    ]
+    deleted_fields = list(field_indexes.deleted_ids(parent_type))
     ui.notify(deleted_fields)
     return deleted_fields
 
+class MatterQueryCache:
+    """Matters found per (access token, field id), dropped after `ttl` seconds or least recently used first."""
+
+    def __init__(self, ttl: float = MATTER_QUERY_TTL, max_size: int = MATTER_QUERY_CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: OrderedDict[tuple, tuple[float, list[dict]]] = OrderedDict()
+
+    def get(self, key: tuple) -> list[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: tuple, matters: list[dict]) -> None:
+        self.entries[key] = (time.monotonic(), matters)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+# Shared by every tab, keyed by token so accounts never see each other's matters
+matter_query_cache = MatterQueryCache()
+
+async def iter_matters_containing_field(field_id, client=None):
+    """
+    Yield pages of the matters holding a value for `field_id`.
+
+    Served from the usage index once it has been built, otherwise from Clio with one
+    cached page while the last walk is still fresh.
+    """
+    client = resolve_async_client(client)
+    index = get_usage_index(client.access_token)
+    if index is not None and index.ready:
+        after_id = -1
+        while page := await run.io_bound(index.matters_page, field_id, after_id):
+            yield page
+            after_id = page[-1]['id']
+        return
+
+    key = (client.access_token, int(field_id))
+    cached = matter_query_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    matters = []
+    params = {
+        "fields": MATTER_QUERY_FIELDS,
+        "custom_field_ids[]": [field_id]
+    }
+    async for page, _ in client.pages("matters.json", conditional=False, **params):
+        matters.extend(page)
+        yield page
+
+    # Only complete walks get here, a cancelled one is never cached
+    matter_query_cache.put(key, matters)
+
+async def get_matters_containing_fields(field_ids) -> list[dict]:
+    """
+    Show the matters holding any of `field_ids` in a paged table, filled in as Clio pages arrive.
+
+    The lookup runs in a task that Cancel (or closing the dialog) stops; rows found so far
+    stay visible and exportable. Returns the rows collected.
+    """
+    field_ids = [int(field_id) for field_id in field_ids]
+    field_data = get_storage()['custom_field_data']
+    names = {field_id: field_data.get(str(field_id), {}).get('name', f"Field {field_id}") for field_id in field_ids}
+
+    rows: list[dict] = []
+    rows_by_matter: dict[int, dict] = {}
+    columns = [
+        {'name': 'display_number', 'label': 'Matter', 'field': 'display_number', 'align': 'left'},
+        {'name': 'description', 'label': 'Description', 'field': 'description', 'align': 'left'},
+        {'name': 'fields', 'label': 'Fields', 'field': 'fields', 'align': 'left'},
+    ]
+
+    def show_page() -> None:
+        start = (pager.value - 1) * MATTERS_PER_PAGE
+        table.rows = rows[start:start + MATTERS_PER_PAGE]
+        table.update()
+
+    def export() -> None:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=['id', 'display_number', 'description', 'fields'])
+        writer.writeheader()
+        writer.writerows(rows)
+        ui.download.content(buffer.getvalue(), 'containing_matters.csv')
+
+    title = names[field_ids[0]] if len(field_ids) == 1 else f'{len(field_ids)} fields'
+    with ui.dialog() as dialog, ui.card().classes('w-full max-w-4xl'):
+        ui.label(f'Matters containing {title}').classes('text-xl font-bold')
+        status = ui.label('Loading...').classes('text-sm text-gray-600')
+        table = ui.table(columns=columns, rows=[], row_key='id').classes('w-full')
+        pager = ui.pagination(1, 1, direction_links=True, on_change=show_page)
+        with ui.row().classes('w-full justify-end'):
+            cancel_button = ui.button('Cancel', on_click=lambda: task.cancel()).props('flat')
+            ui.button('Export CSV', icon='download', on_click=export)
+            ui.button('Close', on_click=dialog.close)
+
+    async def collect() -> None:
+        try:
+            for number, field_id in enumerate(field_ids, start=1):
+                async for page in iter_matters_containing_field(field_id):
+                    for matter in page:
+                        row = rows_by_matter.get(matter['id'])
+                        if row is None:
+                            row = rows_by_matter[matter['id']] = {
+                                'id': matter['id'],
+                                'display_number': matter.get('display_number'),
+                                'description': matter.get('description'),
+                                'fields': names[field_id],
+                            }
+                            rows.append(row)
+                        else:
+                            row['fields'] = f"{row['fields']}, {names[field_id]}"
+
+                    pager.max = max(1, -(-len(rows) // MATTERS_PER_PAGE))
+                    # Later pages do not change what an already full page shows
+                    if len(table.rows) < MATTERS_PER_PAGE or len(field_ids) > 1:
+                        show_page()
+                    status.set_text(f'{len(rows)} matters so far ({number} of {len(field_ids)} fields)...')
+
+            status.set_text(f'{len(rows)} matters')
+        except asyncio.CancelledError:
+            status.set_text(f'Cancelled, {len(rows)} matters found')
+        except Exception as e:
+            logging.debug(f"An error occurred: {e}")
+            status.set_text(f'❌ Failed after {len(rows)} matters: {e}')
+        finally:
+            cancel_button.disable()
 
-def get_matters_containing_field(field_id) -> list[str]:
-    ui.notify(f"Get containing matters: {field_id}")
-    client = app.storage.tab['custom_field_management_api']
-    ui.notify(client)
-    try:
-        params = {
-            "fields": "id,display_number,description",
-            "custom_field_ids__": [field_id]
-        }
-
-        response = client.all.matters(**params)
-        logging.debug(response)
-        ui.notification(response, multi_line= True, timeout=0, close_button=True)
-        return response
-
-    except Exception as e:
-        logging.debug(f"An error occurred: {e}")
-        
\ No newline at end of file
+    dialog.open()
+    task = asyncio.create_task(collect())
+    await dialog
+    task.cancel()
+    return rows
@@ -0,0 +1,174 @@
+from collections import Counter, defaultdict
+from typing import Optional
+
+from .search import SearchIndex
+from .storage import get_storage
+
+class FieldIndexes:
+    """
+    Secondary indexes over `custom_field_data`, kept next to the storage.
+
+    Per parent type: every field id, the deleted ids, and a count of each display_order
+    so the highest one is known without a scan (removing the current maximum rescans only
+    the distinct display_orders of that parent type). Ids are storage keys (str).
+    """
+
+    def __init__(self) -> None:
+        self.records: dict[str, tuple[str, bool, Optional[int]]] = {}  # id -> (parent type, deleted, display_order)
+        self.ids: defaultdict[str, set[str]] = defaultdict(set)
+        self.deleted: defaultdict[str, set[str]] = defaultdict(set)
+        self.orders: defaultdict[str, Counter] = defaultdict(Counter)
+        self.max_orders: dict[str, Optional[int]] = {}
+
+    @staticmethod
+    def record(data: dict) -> tuple[str, bool, Optional[int]]:
+        display_order = data.get('display_order')
+        if not isinstance(display_order, int) or isinstance(display_order, bool):
+            display_order = None
+        return (data.get('parent_type') or '').lower(), data.get('deleted') is True, display_order
+
+    def add(self, field_id, data: dict) -> None:
+        field_id = str(field_id)
+        record = self.record(data)
+        if self.records.get(field_id) == record:
+            return
+        self.remove(field_id)
+
+        parent_type, deleted, display_order = self.records[field_id] = record
+        self.ids[parent_type].add(field_id)
+        if deleted:
+            self.deleted[parent_type].add(field_id)
+        if display_order is not None:
+            self.orders[parent_type][display_order] += 1
+            highest = self.max_orders.get(parent_type)
+            if highest is None or display_order > highest:
+                self.max_orders[parent_type] = display_order
+
+    def remove(self, field_id) -> None:
+        record = self.records.pop(str(field_id), None)
+        if record is None:
+            return
+
+        parent_type, deleted, display_order = record
+        self.ids[parent_type].discard(str(field_id))
+        self.deleted[parent_type].discard(str(field_id))
+        if display_order is not None:
+            counts = self.orders[parent_type]
+            counts[display_order] -= 1
+            if counts[display_order] <= 0:
+                del counts[display_order]
+                if display_order == self.max_orders.get(parent_type):
+                    self.max_orders[parent_type] = max(counts, default=None)
+
+    def sync(self, custom_field_data: dict) -> None:
+        """Bring the indexes in line with a reloaded `custom_field_data`."""
+        for field_id in [field_id for field_id in self.records if field_id not in custom_field_data]:
+            self.remove(field_id)
+        for field_id, data in custom_field_data.items():
+            if isinstance(data, dict):
+                self.add(field_id, data)
+
+    def field_ids(self, parent_type: str) -> set[str]:
+        return self.ids.get(parent_type.lower(), set())
+
+    def deleted_ids(self, parent_type: str) -> set[str]:
+        return self.deleted.get(parent_type.lower(), set())
+
+    def max_display_order(self, parent_type: str) -> Optional[int]:
+        return self.max_orders.get(parent_type.lower())
+
+    def rank(self, field_id) -> tuple:
+        """
+        Sort key of a field within its parent type: display_order, then id; unknown fields last.
+
+        Every write to a record (moves update each shifted display_order) passes through
+        `add`, so this table is the shared, always current order for all set cards.
+        """
+        record = self.records.get(str(field_id))
+        display_order = record[2] if record else None
+        return (display_order if display_order is not None else float('inf'), int(field_id))
+
+class FieldSetMembership:
+    """
+    Field <-> field set membership, both directions in O(1).
+
+    Ids are always ints, whatever the source (storage keys come back as str after a JSON or
+    SQLite round-trip). Each set is updated on its own when its record changes, touching
+    only the fields that joined or left it.
+    """
+
+    def __init__(self) -> None:
+        self.fields_by_set: dict[int, tuple[int, ...]] = {}
+        self.sets_by_field: defaultdict[int, set[int]] = defaultdict(set)
+
+    def set_fields(self, set_id, field_ids) -> None:
+        set_id = int(set_id)
+        field_ids = tuple(dict.fromkeys(int(field_id) for field_id in field_ids))
+        old = self.fields_by_set.get(set_id, ())
+        if old == field_ids:
+            return
+
+        for field_id in set(old).difference(field_ids):
+            self.discard(field_id, set_id)
+        for field_id in set(field_ids).difference(old):
+            self.sets_by_field[field_id].add(set_id)
+        self.fields_by_set[set_id] = field_ids
+
+    def remove_set(self, set_id) -> None:
+        set_id = int(set_id)
+        for field_id in self.fields_by_set.pop(set_id, ()):
+            self.discard(field_id, set_id)
+
+    def discard(self, field_id: int, set_id: int) -> None:
+        set_ids = self.sets_by_field.get(field_id)
+        if set_ids is not None:
+            set_ids.discard(set_id)
+            if not set_ids:
+                del self.sets_by_field[field_id]
+
+    def sync(self, custom_field_set_data: dict) -> None:
+        """Bring the index in line with a reloaded `custom_field_set_data`."""
+        set_ids = {int(set_id) for set_id in custom_field_set_data}
+        for set_id in [set_id for set_id in self.fields_by_set if set_id not in set_ids]:
+            self.remove_set(set_id)
+        for set_id, data in custom_field_set_data.items():
+            self.set_fields(set_id, set_field_ids(data))
+
+    def sets_containing(self, field_id) -> set[int]:
+        return self.sets_by_field.get(int(field_id), set())
+
+    def fields_in(self, set_id) -> tuple[int, ...]:
+        return self.fields_by_set.get(int(set_id), ())
+
+# Shared by every client, like the storage they index
+field_indexes = FieldIndexes()
+field_search_index = SearchIndex()
+field_set_search_index = SearchIndex()
+field_set_membership = FieldSetMembership()
+
+def set_field_ids(data: dict) -> list[int]:
+    return [cf['id'] for cf in data.get('custom_fields', []) if 'id' in cf]
+
+def field_label_text(data: dict) -> str:
+    name = data.get('name')
+    return f'{name} (Deleted)' if data.get('deleted') else name
+
+def index_custom_field(field_id, data: dict) -> None:
+    """Re-index one field after any write to its record (create, rename, delete, reorder)."""
+    field_indexes.add(field_id, data)
+    field_search_index.add(int(field_id), field_label_text(data))
+
+def sync_field_indexes() -> None:
+    custom_field_data = get_storage().get('custom_field_data', {})
+    field_indexes.sync(custom_field_data)
+    field_search_index.sync({int(field_id): field_label_text(data) for field_id, data in custom_field_data.items()})
+
+def index_field_set(set_id, data: dict) -> None:
+    """Re-index one field set after a write to its record."""
+    field_set_search_index.add(int(set_id), data.get('name'))
+    field_set_membership.set_fields(set_id, set_field_ids(data))
+
+def sync_field_set_indexes() -> None:
+    custom_field_set_data = get_storage().get('custom_field_set_data', {})
+    field_set_search_index.sync({int(set_id): data.get('name') for set_id, data in custom_field_set_data.items()})
+    field_set_membership.sync(custom_field_set_data)
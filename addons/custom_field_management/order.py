@@ -0,0 +1,202 @@
+import random
+from typing import Hashable, Iterable, Iterator, Optional
+
+class _Node:
+    __slots__ = ('value', 'priority', 'size', 'left', 'right', 'parent')
+
+    def __init__(self, value: Hashable) -> None:
+        self.value = value
+        self.priority = random.random()
+        self.size = 1
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+        self.parent: Optional[_Node] = None
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node else 0
+
+def _update(node: _Node) -> None:
+    node.size = 1 + _size(node.left) + _size(node.right)
+    if node.left:
+        node.left.parent = node
+    if node.right:
+        node.right.parent = node
+
+def _split(node: Optional[_Node], k: int) -> tuple[Optional[_Node], Optional[_Node]]:
+    """Split into the first `k` values and the rest."""
+    if node is None:
+        return None, None
+    if _size(node.left) >= k:
+        left, node.left = _split(node.left, k)
+        _update(node)
+        return left, node
+    node.right, right = _split(node.right, k - _size(node.left) - 1)
+    _update(node)
+    return node, right
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+class FieldOrder:
+    """
+    Ordered sequence of unique ids with O(log n) position lookups and moves.
+
+    An implicit treap: every node knows its subtree size and parent, so id -> position
+    walks up from the node and position -> id walks down from the root.
+    """
+
+    def __init__(self, values: Iterable[Hashable] = ()) -> None:
+        self.root: Optional[_Node] = None
+        self.nodes: dict[Hashable, _Node] = {}
+        self.extend(values)
+
+    def extend(self, values: Iterable[Hashable]) -> None:
+        """Append values, building them in O(m) before one O(log n) merge."""
+        self._set_root(_merge(self.root, self._build(values)))
+
+    def _build(self, values: Iterable[Hashable]) -> Optional[_Node]:
+        # Cartesian tree construction along the right spine
+        spine: list[_Node] = []
+        for value in values:
+            if value in self.nodes:
+                raise ValueError(f"{value!r} is already in the order")
+            node = self.nodes[value] = _Node(value)
+            last = None
+            while spine and spine[-1].priority < node.priority:
+                last = spine.pop()
+            node.left = last
+            if spine:
+                spine[-1].right = node
+            spine.append(node)
+
+        if not spine:
+            return None
+
+        # Sizes and parents bottom-up (iterative post-order)
+        stack = [(spine[0], False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                _update(node)
+                continue
+            stack.append((node, True))
+            for child in (node.left, node.right):
+                if child:
+                    stack.append((child, False))
+        return spine[0]
+
+    def __len__(self) -> int:
+        return _size(self.root)
+
+    def __contains__(self, value: Hashable) -> bool:
+        return value in self.nodes
+
+    def __iter__(self) -> Iterator[Hashable]:
+        stack: list[_Node] = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.value
+            node = node.right
+
+    def __getitem__(self, index: int) -> Hashable:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("FieldOrder index out of range")
+        node = self.root
+        while True:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.value
+            else:
+                index -= left + 1
+                node = node.right
+
+    def index(self, value: Hashable) -> int:
+        node = self.nodes.get(value)
+        if node is None:
+            raise ValueError(f"{value!r} is not in the order")
+        position = _size(node.left)
+        while node.parent:
+            if node is node.parent.right:
+                position += _size(node.parent.left) + 1
+            node = node.parent
+        return position
+
+    def insert(self, index: int, value: Hashable) -> None:
+        if value in self.nodes:
+            raise ValueError(f"{value!r} is already in the order")
+        node = self.nodes[value] = _Node(value)
+        left, right = _split(self.root, max(0, min(index, len(self))))
+        self._set_root(_merge(_merge(left, node), right))
+
+    def remove(self, value: Hashable) -> int:
+        """Remove `value` and return the position it had."""
+        index = self.index(value)
+        left, rest = _split(self.root, index)
+        node, right = _split(rest, 1)
+        node.parent = None
+        del self.nodes[value]
+        self._set_root(_merge(left, right))
+        return index
+
+    def move(self, value: Hashable, index: int) -> int:
+        """Move `value` to `index` (list pop/insert semantics) and return its old position."""
+        old_index = self.remove(value)
+        self.insert(index, value)
+        return old_index
+
+    def slice(self, start: int, end: int) -> list[Hashable]:
+        """Values at positions [start, end) in O(log n + k)."""
+        start, end = max(0, start), min(end, len(self))
+        result: list[Hashable] = []
+        if start >= end:
+            return result
+
+        # Descend to `start`, keeping the ancestors still to be visited in order
+        stack: list[_Node] = []
+        node, offset = self.root, start
+        while node:
+            left = _size(node.left)
+            if offset < left:
+                stack.append(node)
+                node = node.left
+            elif offset == left:
+                stack.append(node)
+                break
+            else:
+                offset -= left + 1
+                node = node.right
+
+        while stack and len(result) < end - start:
+            node = stack.pop()
+            result.append(node.value)
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+        return result
+
+    def to_list(self) -> list[Hashable]:
+        return list(self)
+
+    def _set_root(self, node: Optional[_Node]) -> None:
+        self.root = node
+        if node:
+            node.parent = None
@@ -1,12 +1,19 @@
 import logging
+import time
 
-from nicegui import ui, app
+from nicegui import ui, app, background_tasks
 
 from .elements import api_input, toggle_deleted_fields, FieldContainer, FieldSetContainer
-from .dialogs import launch_field_set_dialog, fix_field_display_order_dialog, loading_dialog
+from .dialogs import launch_field_set_dialog, loading_dialog, notify_dispatch_report
+from .client import release_async_client
+from .commit_queue import CommitQueue
 from .events import *
 from .styles import styles
+from .scripts import field_filter_script
 from .helper import get_deleted_custom_field_ids
+from .storage import get_storage
+from .sync import DeltaSync, DEFAULT_SYNC_INTERVAL, prefetch_parent_type
+from .usage import get_usage_index, usage_analysis
 from layout.page import get_header_containers
 
 from clio_manage_python_client import ClioManage as API_Connection
@@ -15,6 +22,7 @@ logging.basicConfig(level=logging.DEBUG)
                     
 async def customfield_management_page(parent_type):
     
+    started = time.perf_counter()
     current_page = 'customfield_management'
     current_user = app.storage.user['current_user']
     parent_type = parent_type
@@ -28,8 +36,14 @@ async def customfield_management_page(parent_type):
     center_container, right_container = get_header_containers()
     with right_container:
         def update_client_key(new_access_token):
+            old_access_token = api_client.access_token
             api_client.set_bearer_token(new_access_token)
+            if old_access_token and old_access_token != new_access_token:
+                background_tasks.create(release_async_client(old_access_token), name='release_clio_connection')
             ui.notify('Access Token Set')
+            # Usage badges belong to the account of the token
+            if field_container:
+                field_container.show_usage()
             
         right_container.clear()
         key_input:ui.input = api_input(current_user, callback=update_client_key)
@@ -38,26 +52,51 @@ async def customfield_management_page(parent_type):
         center_container.clear()
         ui.label(f'{parent_type.title()} Custom Fields')
     
-    global_storage = app.storage.general['customfield_management_storage']
+    global_storage = get_storage()
     
     app.storage.client['field_parent_type'] = parent_type
     app.storage.client['last_clicked'] = None
-    app.storage.client['selected_fields'] = []
     app.storage.client['fields'] = {}
     app.storage.client['field_set_cards'] = {}
     
     await ui.context.client.connected()
-    loading = loading_dialog()
+    ui.run_javascript(field_filter_script)
     app.storage.user['last_page'] = f'/customfield_management/{parent_type}'
     
     app.storage.tab['current_page'] = current_page
     app.storage.tab['custom_field_management_api'] = api_client
     
-    async def load_field_storage():
-        await field_container.load_from_api(api_client)
-        await field_set_container.load_from_api()    
+    async def load_field_storage(force: bool = False, background: bool = False):
+        await delta_sync.revalidate(force=force, background=background)
         
     app.storage.client['load_field_storage'] = load_field_storage
+
+    page_client = ui.context.client
+
+    async def reconcile_failed_commit(job, report):
+        # Optimistic changes that did not land are replaced by the server state
+        with page_client:
+            notify_dispatch_report(report, job.labels)
+            # The server may be unchanged (304) while local state is not
+            await load_field_storage(force=True, background=True)
+
+    commit_queue = CommitQueue(on_failure=reconcile_failed_commit)
+    app.storage.client['commit_queue'] = commit_queue
+
+    async def analyze_usage(full: bool = False):
+        notification = ui.notification('Analyzing field usage...', spinner=True, timeout=None)
+        try:
+            usage = await usage_analysis.run(api_client, full=full)
+            notification.message = f'Usage of {len(usage)} fields updated'
+            notification.type = 'positive'
+            field_container.show_usage()
+        except Exception as e:
+            logging.debug(f"An error occurred: {e}")
+            notification.message = f'❌ Usage analysis failed: {e}'
+            notification.type = 'negative'
+        finally:
+            notification.spinner = False
+            notification.timeout = 5
     
     with ui.row().classes('page-container') as page_container:
         
@@ -74,7 +113,10 @@ async def customfield_management_page(parent_type):
                 field_set_container = FieldSetContainer(parent_type=parent_type)
                 
             with ui.row().classes('column-footing'):
-                ui.input(placeholder="Filter by name...").classes('filter-box').props('dense size=32').disable()
+                ui.input(
+                    placeholder="Filter by name...",
+                    on_change=lambda e: field_set_container.set_filter(e.value),
+                ).classes('filter-box').props('dense size=32 debounce=200')
                 
                 with ui.row():
                     ui.button(icon='add', on_click=launch_field_set_dialog)
@@ -99,10 +141,34 @@ async def customfield_management_page(parent_type):
                                 value=True,
                                 on_change=lambda: toggle_deleted_fields(delete_switch.value)
                             )
+                            # Reflects the effective mode (bound once the container exists), only user clicks store a preference
+                            virtual_switch = ui.switch('Windowed List')
+                            virtual_switch.on('update:model-value', lambda e: field_container.set_virtual(e.args))
+                            virtual_switch.tooltip(f'Render only the fields near the viewport (on by default above {FieldContainer.VIRTUAL_THRESHOLD} fields)')
                             ui.button('Show Deleted Fields', on_click= lambda: get_deleted_custom_field_ids(parent_type))
+                            ui.button('Select All', on_click=lambda: field_container.selection.select_all())
+                            ui.button('Invert Selection', on_click=lambda: field_container.selection.invert())
+                            if parent_type == 'matter':
+                                ui.button('Analyze Field Usage', on_click=lambda: analyze_usage()).bind_enabled_from(
+                                    usage_analysis, 'running', backward=lambda running: api_client.access_token not in running
+                                )
+                                ui.button('Rescan All Matters', on_click=lambda: analyze_usage(full=True)).bind_enabled_from(
+                                    usage_analysis, 'running', backward=lambda running: api_client.access_token not in running
+                                ).tooltip('Rebuild the usage index, also drops matters deleted in Clio')
+                                ui.label().classes('text-sm text-gray-600').bind_text_from(
+                                    usage_analysis, 'status', backward=lambda status: status.get(api_client.access_token, '')
+                                )
+                            ui.number(
+                                'Sync every (s)',
+                                value=app.storage.user.get('customfield_sync_interval', DEFAULT_SYNC_INTERVAL),
+                                min=0,
+                                step=15,
+                                on_change=lambda e: set_sync_interval(e.value),
+                            ).props('dense debounce=500').tooltip('Pull changes made in Clio in the background, 0 turns it off')
             # Scroll area for cards
-            with ui.scroll_area().classes('scroll-container'):
-                field_container = FieldContainer(parent_type=parent_type, global_storage=global_storage)       
+            with ui.scroll_area().classes('scroll-container') as field_scroll_area:
+                field_container = FieldContainer(parent_type=parent_type, global_storage=global_storage, scroll_area=field_scroll_area)
+            virtual_switch.bind_value_from(field_container, 'virtual')
 
             # Filter row with proper wrapping
             with ui.row().classes('column-footing'):
@@ -110,34 +176,86 @@ async def customfield_management_page(parent_type):
                 def filter_fields():
                     search_text = custom_field_filter.value.strip().lower()
                     logging.debug(f"Filtering with: {search_text}")
-
-                    field_cards = app.storage.client.get('fields', {})
-
-                    for card in field_cards.values():
-                        if hasattr(card, 'update_visibility'):
-                            card.update_visibility(search_text)
-                        else:
-                            logging.warning(f"Card {getattr(card, 'clio_id', 'unknown')} does not support visibility filtering.")
+                    field_container.set_filter(search_text)
                             
+                # Filtering runs in the browser; the server only hears the text once typing pauses
                 custom_field_filter = ui.input(
                     placeholder="Filter fields by name...",
                     on_change=filter_fields,
-                ).classes('filter-box').props('dense size=32')
+                ).classes('filter-box').props('dense size=32 debounce=200')
+                custom_field_filter.on('update:value', js_handler='(value) => customFieldFilter.filter(value)')
                 with custom_field_filter.add_slot('prepend'):
                     ui.icon('search')
                     
                 with custom_field_filter.add_slot('append'):
                     clear_icon = ui.icon('clear').classes('clear-icon') 
-                    clear_icon.on('click', lambda: custom_field_filter.set_value(''))
+                    def clear_filter():
+                        custom_field_filter.set_value('')
+                        ui.run_javascript("customFieldFilter.filter('')")
+                    clear_icon.on('click', clear_filter)
         
+                with ui.row().classes('items-center') as revalidating_status:
+                    ui.spinner(size='sm')
+                    ui.label('Revalidating...').classes('text-sm text-gray-600')
+
+                with ui.row().classes('items-center').bind_visibility_from(commit_queue, 'busy'):
+                    ui.spinner(size='sm')
+                    ui.label().classes('text-sm text-gray-600').bind_text_from(commit_queue, 'status')
+                    ui.button(icon='close', on_click=commit_queue.cancel).props('flat dense').tooltip('Cancel pending changes')
+
                 with ui.row():
                     ui.button(icon='add', on_click=launch_field_dialog)
                     ui.button(icon='refresh', on_click= lambda: load_field_storage())
 
-    if key_input.value:
-        await load_field_storage()
-    
+    # Background delta sync, pulls only what changed in Clio since the last load
+    delta_sync = DeltaSync(parent_type, field_container, field_set_container, commit_queue, api_client)
+    revalidating_status.bind_visibility_from(delta_sync, 'revalidating')
+    sync_interval = app.storage.user.get('customfield_sync_interval', DEFAULT_SYNC_INTERVAL)
+
+    async def run_delta_sync():
+        if key_input.value:
+            await delta_sync.run()
+
+    sync_timer = ui.timer(sync_interval or DEFAULT_SYNC_INTERVAL, run_delta_sync, active=bool(sync_interval))
+
+    def set_sync_interval(value):
+        interval = max(int(value or 0), 0)
+        app.storage.user['customfield_sync_interval'] = interval
+        sync_timer.interval = interval or DEFAULT_SYNC_INTERVAL
+        sync_timer.active = bool(interval)
+
+    # Stale-while-revalidate: show the last session's snapshot right away and let the load apply the differences
+    has_snapshot = bool(global_storage[parent_type]['custom_field_id_list'] or global_storage[parent_type]['custom_field_set_id_list'])
+    if has_snapshot:
+        field_container.refresh()
+        field_set_container.refresh()
+    elif key_input.value:
+        # Nothing stored yet, draw fields as Clio pages arrive and drop the dialog after the first
+        loading = loading_dialog()
+        await delta_sync.stream(on_page=loading.close)
+        loading.close()
+
     if custom_field_filter.value:
         filter_fields()
-        
-    loading.close()
\ No newline at end of file
+
+    logging.debug(f"{parent_type.title()} custom fields interactive after {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    if key_input.value:
+        if has_snapshot:
+            await load_field_storage()
+
+        # Warm storage for the other parent type so switching pages does not wait on Clio
+        other_parent_type = 'contact' if parent_type == 'matter' else 'matter'
+        background_tasks.create(prefetch_parent_type(other_parent_type, api_client), name=f'prefetch_{other_parent_type}_custom_fields')
+
+        # Bring an existing usage index up to date with matters changed since the last visit
+        usage_index = get_usage_index(api_client.access_token) if parent_type == 'matter' else None
+        if usage_index is not None and usage_index.ready and not usage_analysis.is_running(api_client.access_token):
+            async def refresh_usage():
+                try:
+                    await usage_analysis.run(api_client)
+                    with page_client:
+                        field_container.show_usage()
+                except Exception as e:
+                    logging.debug(f"An error occurred: {e}")
+            background_tasks.create(refresh_usage(), name='refresh_field_usage')
\ No newline at end of file
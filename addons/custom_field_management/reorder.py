@@ -0,0 +1,131 @@
+from bisect import bisect_left
+from typing import NamedTuple
+
+class Move(NamedTuple):
+    """Move `field_id` to `index`, shifting the fields in between (Clio display_order semantics)."""
+    field_id: int
+    index: int
+
+def longest_increasing_subsequence(values: list[int]) -> set[int]:
+    """Return the indexes of one longest strictly increasing subsequence of `values` in O(n log n)."""
+    tails: list[int] = []        # smallest tail value of an increasing run of each length
+    tail_index: list[int] = []   # index in `values` of that tail
+    previous: list[int] = [-1] * len(values)
+
+    for i, value in enumerate(values):
+        length = bisect_left(tails, value)
+        if length == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[length] = value
+            tail_index[length] = i
+        previous[i] = tail_index[length - 1] if length else -1
+
+    keep = set()
+    i = tail_index[-1] if tail_index else -1
+    while i != -1:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+def insert_order(current: list[int], moving_ids: list[int], target_id: int, position: str) -> list[int]:
+    """Return `current` with `moving_ids` grouped (in their current order) before/after `target_id`."""
+    moving = set(moving_ids)
+    remaining = [fid for fid in current if fid not in moving]
+    block = [fid for fid in current if fid in moving]
+
+    if target_id in moving:
+        # Target is part of the block, keep the block where the target was
+        target_index = current.index(target_id)
+        insert_index = sum(1 for fid in current[:target_index] if fid not in moving)
+    else:
+        insert_index = remaining.index(target_id)
+        if position == "after":
+            insert_index += 1
+
+    return remaining[:insert_index] + block + remaining[insert_index:]
+
+def plan_reorder(current: list[int], desired: list[int]) -> list[Move]:
+    """
+    Return the fewest display_order moves that turn `current` into `desired`.
+
+    Fields on a longest increasing subsequence of current positions already sit in the
+    right relative order and are never patched; every other field is moved directly
+    behind its predecessor in `desired`, in `desired` order.
+    """
+    if len(current) != len(desired) or set(current) != set(desired):
+        raise ValueError("Desired order must be a permutation of the current order")
+
+    order = list(current)
+    position = {fid: i for i, fid in enumerate(order)}
+    keep = longest_increasing_subsequence([position[fid] for fid in desired])
+
+    moves: list[Move] = []
+    for i, fid in enumerate(desired):
+        if i in keep:
+            continue
+
+        start = position[fid]
+        if i == 0:
+            index = 0
+        else:
+            predecessor = position[desired[i - 1]]
+            index = predecessor + 1 if start > predecessor else predecessor
+
+        order.insert(index, order.pop(start))
+        for j in range(min(start, index), max(start, index) + 1):
+            position[order[j]] = j
+
+        moves.append(Move(fid, index))
+
+    return moves
+
+def plan_normalization(orders: dict[int, int]) -> list[Move]:
+    """
+    Return the fewest display_order changes that make `orders` (field id -> display_order)
+    contiguous without changing the order the fields are shown in (ties broken by id).
+
+    The numbering starts at 0 like the positions the move path PATCHes; each move sets
+    an absolute display_order and moves never depend on each other.
+    """
+    desired = [fid for _, fid in sorted((order, fid) for fid, order in orders.items())]
+    return [Move(fid, index) for index, fid in enumerate(desired) if orders[fid] != index]
+
+def apply_moves(order: list[int], moves: list[Move]) -> list[int]:
+    """Replay `moves` on a copy of `order`."""
+    order = list(order)
+    for move in moves:
+        order.remove(move.field_id)
+        order.insert(move.index, move.field_id)
+    return order
+
+def group_independent_moves(order: list[int], moves: list[Move]) -> list[list[Move]]:
+    """
+    Split a plan into waves of consecutive moves that can be sent concurrently.
+
+    A move only shifts the fields between its old and new index, so moves whose spans
+    do not overlap commute. Each wave holds moves with pairwise disjoint spans; waves
+    must still be applied one after another.
+    """
+    order = list(order)
+    position = {fid: i for i, fid in enumerate(order)}
+    waves: list[list[Move]] = []
+    spans: list[tuple[int, int]] = []
+
+    for move in moves:
+        start = position[move.field_id]
+        span = (min(start, move.index), max(start, move.index))
+
+        if waves and all(span[1] < low or span[0] > high for low, high in spans):
+            waves[-1].append(move)
+            spans.append(span)
+        else:
+            waves.append([move])
+            spans = [span]
+
+        order.insert(move.index, order.pop(start))
+        for j in range(span[0], span[1] + 1):
+            position[order[j]] = j
+
+    return waves
@@ -0,0 +1,47 @@
+field_filter_script = '''
+// Name filter for the field cards, run in the browser so typing costs no round trips.
+// The server pushes {card element id: [lowercase label, deleted]} and only sends changes after that.
+window.customFieldFilter?.style?.remove();
+window.customFieldFilter = {
+    entries: {},
+    text: '',
+    showDeleted: true,
+    style: null,
+
+    reset(entries) {
+        this.entries = entries;
+        this.apply();
+    },
+
+    update(entries, removed) {
+        Object.assign(this.entries, entries);
+        for (const id of removed) delete this.entries[id];
+        this.apply();
+    },
+
+    filter(text) {
+        this.text = (text || '').trim().toLowerCase();
+        this.apply();
+    },
+
+    setShowDeleted(value) {
+        this.showDeleted = value;
+        this.apply();
+    },
+
+    apply() {
+        // One stylesheet rule instead of per-card styles, so Vue re-renders never undo it
+        if (!this.style || !this.style.isConnected) {
+            this.style = document.createElement('style');
+            document.head.appendChild(this.style);
+        }
+        const hidden = [];
+        for (const [id, [label, deleted]] of Object.entries(this.entries)) {
+            if ((deleted && !this.showDeleted) || (this.text && !label.includes(this.text))) {
+                hidden.push(`#c${id}`);
+            }
+        }
+        this.style.textContent = hidden.length ? `${hidden.join(',')} { display: none !important; }` : '';
+    },
+};
+'''
@@ -0,0 +1,118 @@
+import heapq
+from collections import Counter, defaultdict
+from typing import Hashable, Optional
+
+class SearchIndex:
+    """
+    In-memory n-gram index over names for substring and ranked fuzzy lookups.
+
+    Every 1-, 2- and 3-character substring of a name maps to the keys containing it, so
+    queries of up to three characters are a single lookup and longer ones intersect the
+    trigram postings (smallest first) before a final substring check on the few
+    candidates left. Names are added, replaced and removed one key at a time.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, names: dict[Hashable, str] = None) -> None:
+        self.names: dict[Hashable, str] = {}
+        self.postings: defaultdict[str, set] = defaultdict(set)
+        if names:
+            self.sync(names)
+
+    @staticmethod
+    def normalize(text: Optional[str]) -> str:
+        return (text or '').strip().lower()
+
+    def grams(self, text: str, size: int = None) -> set[str]:
+        sizes = [size] if size else range(1, self.GRAM_SIZE + 1)
+        return {text[i:i + n] for n in sizes for i in range(len(text) - n + 1)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.names
+
+    def add(self, key: Hashable, name: Optional[str]) -> None:
+        """Index `name` under `key`, replacing what was indexed for it before."""
+        text = self.normalize(name)
+        old = self.names.get(key)
+        if old == text:
+            return
+        if old is not None:
+            self.remove(key)
+        self.names[key] = text
+        for gram in self.grams(text):
+            self.postings[gram].add(key)
+
+    def remove(self, key: Hashable) -> None:
+        text = self.names.pop(key, None)
+        if text is None:
+            return
+        for gram in self.grams(text):
+            keys = self.postings[gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[gram]
+
+    def sync(self, names: dict[Hashable, str]) -> None:
+        """Bring the index in line with `names`, touching only keys that changed."""
+        for key in [key for key in self.names if key not in names]:
+            self.remove(key)
+        for key, name in names.items():
+            self.add(key, name)
+
+    def matches(self, query: str) -> set:
+        """Keys whose name contains `query`."""
+        query = self.normalize(query)
+        if not query:
+            return set(self.names)
+        if len(query) <= self.GRAM_SIZE:
+            return set(self.postings.get(query, ()))
+
+        postings = sorted((self.postings.get(gram, set()) for gram in self.grams(query, self.GRAM_SIZE)), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {key for key in candidates if query in self.names[key]}
+
+    def rank(self, query: str, key: Hashable) -> tuple:
+        """Sort key for a substring match: name prefix, then word prefix, then shortest name."""
+        name = self.names[key]
+        position = name.find(query)
+        if position == 0:
+            kind = 0
+        elif not name[position - 1].isalnum():
+            kind = 1
+        else:
+            kind = 2
+        return kind, len(name), name
+
+    def search(self, query: str, limit: int = 20, fuzzy: bool = True, threshold: float = 0.4) -> list:
+        """
+        Ranked keys for `query`: substring matches first, then (if `fuzzy`) names sharing
+        enough trigrams with the query to survive a typo or two, by Dice similarity.
+        """
+        query = self.normalize(query)
+        if not query:
+            return []
+
+        exact = heapq.nsmallest(limit, self.matches(query), key=lambda key: self.rank(query, key))
+        if not fuzzy or len(exact) >= limit or len(query) < self.GRAM_SIZE:
+            return exact
+
+        query_grams = self.grams(query, self.GRAM_SIZE)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+
+        found = set(exact)
+        scored = []
+        for key, count in shared.items():
+            if key in found:
+                continue
+            name_grams = max(len(self.names[key]) - self.GRAM_SIZE + 1, 1)
+            score = 2 * count / (len(query_grams) + name_grams)
+            if score >= threshold:
+                scored.append((-score, len(self.names[key]), key))
+        scored = heapq.nsmallest(limit - len(exact), scored, key=lambda item: item[:2])
+        return exact + [key for _, _, key in scored]
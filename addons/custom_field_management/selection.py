@@ -0,0 +1,99 @@
+from typing import Callable, Iterable, Iterator, Optional
+
+from nicegui.binding import BindableProperty
+
+from .order import FieldOrder
+
+class SelectionModel:
+    """
+    Selected field ids, tied to the current visible (filtered) order.
+
+    Ranges are resolved against an order of visible ids only, so a shift-range costs
+    O(log n + range) and never touches filtered-out fields. Selection order is kept,
+    the last selected id is the anchor for the next range.
+    """
+
+    count = BindableProperty()
+
+    def __init__(self, on_change: Callable[[Iterable[int]], None] = None) -> None:
+        self.selected: dict[int, None] = {}
+        self.visible = FieldOrder()
+        self.on_change = on_change
+        self.count = 0
+
+    def __contains__(self, field_id: int) -> bool:
+        return field_id in self.selected
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self.selected))
+
+    def __len__(self) -> int:
+        return len(self.selected)
+
+    @property
+    def anchor(self) -> Optional[int]:
+        return next(reversed(self.selected), None)
+
+    def set_visible_order(self, visible_ids: Iterable[int]) -> None:
+        """Rebuild the visible order once per filter or order change."""
+        self.visible = FieldOrder(visible_ids)
+
+    def select(self, field_ids: Iterable[int]) -> None:
+        added = [field_id for field_id in field_ids if field_id not in self.selected]
+        for field_id in added:
+            self.selected[field_id] = None
+        self.changed(added)
+
+    def deselect(self, field_ids: Iterable[int]) -> None:
+        removed = [field_id for field_id in field_ids if field_id in self.selected]
+        for field_id in removed:
+            del self.selected[field_id]
+        self.changed(removed)
+
+    def toggle(self, field_id: int) -> None:
+        if field_id in self.selected:
+            self.deselect([field_id])
+        else:
+            self.select([field_id])
+
+    def clear(self) -> None:
+        cleared = list(self.selected)
+        self.selected.clear()
+        self.changed(cleared)
+
+    def select_range(self, anchor_id: int, field_id: int) -> None:
+        """Select every visible field between the anchor and `field_id`, inclusive."""
+        if anchor_id not in self.visible or field_id not in self.visible:
+            # Anchor was filtered out since it was selected
+            self.select([field_id])
+            return
+
+        anchor_index = self.visible.index(anchor_id)
+        index = self.visible.index(field_id)
+        range_ids = self.visible.slice(min(anchor_index, index), max(anchor_index, index) + 1)
+        # Keep the clicked field as the anchor for the next range
+        if index < anchor_index:
+            range_ids.reverse()
+        self.select(range_ids)
+
+    def select_all(self) -> None:
+        self.select(self.visible)
+
+    def invert(self) -> None:
+        """Swap selected and unselected among the visible fields."""
+        selecting = [field_id for field_id in self.visible if field_id not in self.selected]
+        deselecting = [field_id for field_id in self.selected if field_id in self.visible]
+        for field_id in deselecting:
+            del self.selected[field_id]
+        for field_id in selecting:
+            self.selected[field_id] = None
+        self.changed(deselecting + selecting)
+
+    def retain(self, field_ids: set[int]) -> None:
+        """Drop selected ids that no longer exist."""
+        self.deselect([field_id for field_id in self.selected if field_id not in field_ids])
+
+    def changed(self, field_ids: list[int]) -> None:
+        self.count = len(self.selected)
+        if field_ids and self.on_change:
+            self.on_change(field_ids)
@@ -0,0 +1,424 @@
+import json
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Iterable
+
+from nicegui import app
+from nicegui.observables import ObservableDict, ObservableList
+
+logging.basicConfig(level=logging.DEBUG)
+
+STORAGE_KEY = 'customfield_management_storage'
+# Keyed by Clio id, persisted one row per record
+RECORD_TABLES = ('custom_field_data', 'custom_field_set_data')
+# 'sqlite' or 'json' (the original app.storage.general file)
+STORAGE_BACKEND = 'sqlite'
+# Kept apart from NiceGUI's storage folder, which app.storage.clear() removes
+STORAGE_PATH = Path(os.environ.get('CUSTOMFIELD_STORAGE_PATH', '.customfield_management')).resolve()
+
+class StorageBackend:
+    """Persistence for customfield_management_storage: small documents plus per-record tables."""
+
+    def load(self) -> tuple[dict[str, Any], dict[str, dict[str, dict]]]:
+        """Return (documents, {table: {id: record}})."""
+        raise NotImplementedError
+
+    def save_document(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete_document(self, key: str) -> None:
+        raise NotImplementedError
+
+    def upsert_records(self, table: str, records: dict[str, dict]) -> None:
+        raise NotImplementedError
+
+    def delete_records(self, table: str, record_ids: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def record_ids(self, table: str, parent_type: str) -> list[str]:
+        """Ids of one parent type in display_order."""
+        raise NotImplementedError
+
+    def batch(self):
+        """Context in which every write lands in one backend transaction."""
+        return nullcontext()
+
+    def close(self) -> None:
+        pass
+
+class JsonBackend(StorageBackend):
+    """The original layout: everything nested under one key of app.storage.general."""
+
+    def __init__(self) -> None:
+        self.data = app.storage.general.setdefault(STORAGE_KEY, {})
+
+    def load(self):
+        data = json.loads(json.dumps(self.data))
+        tables = {table: data.pop(table, {}) for table in RECORD_TABLES}
+        return data, tables
+
+    def save_document(self, key, value):
+        self.data[key] = json.loads(json.dumps(value))
+
+    def delete_document(self, key):
+        self.data.pop(key, None)
+
+    def upsert_records(self, table, records):
+        stored = self.data.setdefault(table, {})
+        for record_id, record in records.items():
+            stored[record_id] = json.loads(json.dumps(record))
+
+    def delete_records(self, table, record_ids):
+        stored = self.data.setdefault(table, {})
+        for record_id in record_ids:
+            stored.pop(record_id, None)
+
+    def record_ids(self, table, parent_type):
+        records = self.data.get(table, {})
+        matching = [
+            (record.get('display_order') or 0, record_id)
+            for record_id, record in records.items()
+            if (record.get('parent_type') or '').lower() == parent_type.lower()
+        ]
+        return [record_id for _, record_id in sorted(matching)]
+
+class SQLiteBackend(StorageBackend):
+    """
+    Local SQLite file with one row per field / field set and one row per document.
+
+    A display_order change upserts one row instead of rewriting the whole JSON store,
+    and records are indexed by (parent_type, display_order).
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS documents (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS records (
+            tbl TEXT NOT NULL,
+            id TEXT NOT NULL,
+            parent_type TEXT,
+            display_order INTEGER,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL,
+            PRIMARY KEY (tbl, id)
+        );
+        CREATE INDEX IF NOT EXISTS records_parent_order ON records (tbl, parent_type, display_order);
+    '''
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        self.batching = False
+
+    @staticmethod
+    def row(table: str, record_id: str, record: dict) -> tuple:
+        display_order = record.get('display_order')
+        return (
+            table,
+            str(record_id),
+            (record.get('parent_type') or '').lower() or None,
+            display_order if isinstance(display_order, int) else None,
+            1 if record.get('deleted') else 0,
+            json.dumps(record),
+        )
+
+    def is_empty(self) -> bool:
+        documents = self.connection.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        records = self.connection.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+        return not documents and not records
+
+    def load(self):
+        documents = {key: json.loads(value) for key, value in self.connection.execute('SELECT key, value FROM documents')}
+        tables: dict[str, dict[str, dict]] = {table: {} for table in RECORD_TABLES}
+        for table, record_id, data in self.connection.execute('SELECT tbl, id, data FROM records ORDER BY rowid'):
+            tables.setdefault(table, {})[record_id] = json.loads(data)
+        return documents, tables
+
+    @contextmanager
+    def batch(self):
+        self.batching = True
+        try:
+            with self.connection:
+                yield
+        finally:
+            self.batching = False
+
+    def writing(self):
+        # Inside a batch the outer `with self.connection` commits
+        return nullcontext() if self.batching else self.connection
+
+    def save_document(self, key, value):
+        with self.writing():
+            self.connection.execute(
+                'INSERT INTO documents (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, json.dumps(value)),
+            )
+
+    def delete_document(self, key):
+        with self.writing():
+            self.connection.execute('DELETE FROM documents WHERE key = ?', (key,))
+
+    def upsert_records(self, table, records):
+        if not records:
+            return
+        with self.writing():
+            self.connection.executemany(
+                'INSERT INTO records (tbl, id, parent_type, display_order, deleted, data) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(tbl, id) DO UPDATE SET parent_type = excluded.parent_type, display_order = excluded.display_order, '
+                'deleted = excluded.deleted, data = excluded.data',
+                [self.row(table, record_id, record) for record_id, record in records.items()],
+            )
+
+    def delete_records(self, table, record_ids):
+        with self.writing():
+            self.connection.executemany('DELETE FROM records WHERE tbl = ? AND id = ?', [(table, str(record_id)) for record_id in record_ids])
+
+    def record_ids(self, table, parent_type):
+        rows = self.connection.execute(
+            'SELECT id FROM records WHERE tbl = ? AND parent_type = ? ORDER BY display_order, id',
+            (table, parent_type.lower()),
+        )
+        return [record_id for (record_id,) in rows]
+
+    def migrate_from_json(self) -> bool:
+        """Import the app.storage.general copy once, then drop it from the JSON file."""
+        legacy = app.storage.general.get(STORAGE_KEY)
+        if not legacy or not self.is_empty():
+            return False
+
+        data = json.loads(json.dumps(legacy))
+        with self.connection:
+            for key, value in data.items():
+                if key in RECORD_TABLES:
+                    self.connection.executemany(
+                        'INSERT OR REPLACE INTO records (tbl, id, parent_type, display_order, deleted, data) VALUES (?, ?, ?, ?, ?, ?)',
+                        [self.row(key, record_id, record) for record_id, record in value.items() if isinstance(record, dict)],
+                    )
+                else:
+                    self.connection.execute('INSERT OR REPLACE INTO documents (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+        del app.storage.general[STORAGE_KEY]
+        logging.debug(f"Migrated {STORAGE_KEY} from the JSON storage file to {self.path}")
+        return True
+
+    def close(self) -> None:
+        self.connection.close()
+
+class UnitOfWork:
+    """What changed while a transaction is open, written once when it commits."""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.documents: set[str] = set()
+        self.upserts: defaultdict[str, set[str]] = defaultdict(set)
+        self.deletes: defaultdict[str, set[str]] = defaultdict(set)
+
+    @property
+    def active(self) -> bool:
+        return self.depth > 0
+
+    def __bool__(self) -> bool:
+        return bool(self.documents or any(self.upserts.values()) or any(self.deletes.values()))
+
+    def clear(self) -> None:
+        self.documents.clear()
+        self.upserts.clear()
+        self.deletes.clear()
+
+class RecordTable(dict):
+    """Records by Clio id (str); any change to one record upserts only that record."""
+
+    def __init__(self, name: str, backend: StorageBackend, records: dict[str, dict] = None, unit: UnitOfWork = None) -> None:
+        super().__init__()
+        self.name = name
+        self.backend = backend
+        self.unit = unit if unit is not None else UnitOfWork()
+        for record_id, record in (records or {}).items():
+            dict.__setitem__(self, str(record_id), self.observe(str(record_id), record))
+
+    def observe(self, record_id: str, record: dict) -> ObservableDict:
+        return ObservableDict(dict(record), on_change=lambda: self.save(record_id))
+
+    def save(self, *record_ids: str) -> None:
+        if self.unit.active:
+            self.unit.upserts[self.name].update(record_ids)
+            self.unit.deletes[self.name].difference_update(record_ids)
+            return
+        self.backend.upsert_records(self.name, {record_id: self[record_id] for record_id in record_ids if record_id in self})
+
+    def delete(self, *record_ids: str) -> None:
+        if self.unit.active:
+            self.unit.deletes[self.name].update(record_ids)
+            self.unit.upserts[self.name].difference_update(record_ids)
+            return
+        self.backend.delete_records(self.name, record_ids)
+
+    def __setitem__(self, record_id, record: dict) -> None:
+        record_id = str(record_id)
+        dict.__setitem__(self, record_id, self.observe(record_id, record))
+        self.save(record_id)
+
+    def __delitem__(self, record_id) -> None:
+        dict.__delitem__(self, str(record_id))
+        self.delete(str(record_id))
+
+    def pop(self, record_id, *default):
+        if str(record_id) not in self:
+            return dict.pop(self, str(record_id), *default)
+        record = dict.pop(self, str(record_id))
+        self.delete(str(record_id))
+        return record
+
+    def setdefault(self, record_id, default: dict = None):
+        if str(record_id) not in self:
+            self[record_id] = default or {}
+        return self[str(record_id)]
+
+    def replace(self, records: dict) -> None:
+        """Swap in a reloaded table, writing only the records that are new, changed or gone."""
+        records = {str(record_id): record for record_id, record in records.items()}
+        removed = [record_id for record_id in self if record_id not in records]
+        changed = []
+        with_changes = {}
+        for record_id, record in records.items():
+            current = dict.get(self, record_id)
+            if current is not None and current == record:
+                # Same content (and etag) as stored, keep the existing record
+                with_changes[record_id] = current
+            else:
+                with_changes[record_id] = self.observe(record_id, record)
+                changed.append(record_id)
+
+        dict.clear(self)
+        dict.update(self, with_changes)
+        if removed:
+            self.delete(*removed)
+        if changed:
+            self.save(*changed)
+
+class CustomFieldStorage(dict):
+    """
+    customfield_management_storage on a pluggable backend.
+
+    Reads are served from memory with the same nested-dict shape as before. Record tables
+    persist per record and every other top-level key persists as its own document, so a
+    change only writes what it touched. Inside `transaction()` those writes are collected
+    and flushed once.
+    """
+
+    def __init__(self, backend: StorageBackend) -> None:
+        super().__init__()
+        self.backend = backend
+        self.unit = UnitOfWork()
+        documents, tables = backend.load()
+        for table in RECORD_TABLES:
+            dict.__setitem__(self, table, RecordTable(table, backend, tables.get(table), self.unit))
+        for key, value in documents.items():
+            dict.__setitem__(self, key, self.observe(key, value))
+
+    def observe(self, key: str, value: Any) -> Any:
+        if isinstance(value, dict):
+            return ObservableDict(dict(value), on_change=lambda: self.save(key))
+        if isinstance(value, list):
+            return ObservableList(list(value), on_change=lambda: self.save(key))
+        return value
+
+    def save(self, key: str) -> None:
+        if self.unit.active:
+            self.unit.documents.add(key)
+            return
+        if key in self:
+            self.backend.save_document(key, self[key])
+        else:
+            self.backend.delete_document(key)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a bulk operation as one unit of work. Records and documents it touches are
+        tracked and written once, in one backend transaction, when the outermost block
+        exits. Memory is the source of truth, so the changes are flushed even if it raises.
+        """
+        self.unit.depth += 1
+        try:
+            yield self
+        finally:
+            self.unit.depth -= 1
+            if not self.unit.active:
+                self.commit()
+
+    def commit(self) -> None:
+        unit = self.unit
+        if not unit:
+            return
+
+        with self.backend.batch():
+            for table, record_ids in unit.deletes.items():
+                if record_ids:
+                    self.backend.delete_records(table, record_ids)
+            for table, record_ids in unit.upserts.items():
+                if record_ids:
+                    records: RecordTable = self[table]
+                    self.backend.upsert_records(table, {record_id: records[record_id] for record_id in record_ids if record_id in records})
+            for key in unit.documents:
+                if key in self:
+                    self.backend.save_document(key, self[key])
+                else:
+                    self.backend.delete_document(key)
+
+        logging.debug(
+            f"Storage commit: {sum(map(len, unit.upserts.values()))} upserted, {sum(map(len, unit.deletes.values()))} deleted, "
+            f"{len(unit.documents)} document(s)"
+        )
+        unit.clear()
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in RECORD_TABLES:
+            self[key].replace(value)
+            return
+        dict.__setitem__(self, key, self.observe(key, value))
+        self.save(key)
+
+    def __delitem__(self, key: str) -> None:
+        dict.__delitem__(self, key)
+        self.save(key)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def record_ids(self, table: str, parent_type: str) -> list[str]:
+        return self.backend.record_ids(table, parent_type)
+
+def create_backend(kind: str = STORAGE_BACKEND) -> StorageBackend:
+    if kind == 'json':
+        return JsonBackend()
+    backend = SQLiteBackend(STORAGE_PATH / 'storage.sqlite3')
+    backend.migrate_from_json()
+    return backend
+
+_storage: CustomFieldStorage = None
+
+def get_storage() -> CustomFieldStorage:
+    """The customfield_management_storage root, opened on first use."""
+    global _storage
+    if _storage is None:
+        _storage = CustomFieldStorage(create_backend())
+    return _storage
+
+def close_storage() -> None:
+    global _storage
+    if _storage is not None:
+        _storage.backend.close()
+        _storage = None
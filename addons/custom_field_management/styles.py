@@ -72,6 +72,13 @@ styles = '''
     margin: 0;
 }
 
+.usage-badge {
+    position: absolute;
+    right: 8px;
+    top: 50%;
+    transform: translateY(-50%);
+}
+
 .field-card:hover {
     background-color: #f2f2f2; /* light gray */
 }
@@ -111,6 +118,19 @@ styles = '''
     padding: 4px 10px 4px 10px; /* top right bottom left */
 }
 
+/* Windowed field list: every row has the same height so rows can be positioned by index */
+.virtual-field-card {
+    height: 34px;
+    min-height: 34px;
+    overflow: hidden;
+}
+
+.virtual-field-card > div {
+    white-space: nowrap;
+    overflow: hidden;
+    text-overflow: ellipsis;
+}
+
 .custom-select .q-field__native,
 .custom-select .q-placeholder,
 .custom-select .q-field__label {
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
+
+from .api import get_custom_fields_async, get_custom_field_sets_async, store_display_order_results, update_custom_field_display_order_async
+from .dispatcher import Dispatcher, DispatchReport
+from .reorder import Move, plan_normalization
+from .indexes import field_indexes, index_custom_field, index_field_set, sync_field_indexes, sync_field_set_indexes
+from .storage import get_storage
+
+if TYPE_CHECKING:
+    from .commit_queue import CommitQueue
+    from .elements import FieldContainer, FieldSetContainer
+
+logging.basicConfig(level=logging.DEBUG)
+
+# Seconds between delta syncs unless the user picked another interval, 0 turns them off
+DEFAULT_SYNC_INTERVAL = 60
+
+def high_water_mark(parent_type: str, kind: str) -> Optional[str]:
+    """Latest `updated_at` already merged for `kind` ('custom_fields' or 'custom_field_sets')."""
+    return get_storage().get('sync_high_water_marks', {}).get(parent_type.lower(), {}).get(kind)
+
+def advance_high_water_mark(parent_type: str, kind: str, items: list[dict]) -> None:
+    """Move the mark to the newest `updated_at` in `items`, compared as timestamps (Clio sends offsets)."""
+    current = high_water_mark(parent_type, kind)
+    newest = current
+    for item in items:
+        updated_at = item.get('updated_at')
+        if updated_at and (newest is None or datetime.fromisoformat(updated_at) > datetime.fromisoformat(newest)):
+            newest = updated_at
+    if newest != current:
+        marks = get_storage().setdefault('sync_high_water_marks', {})
+        marks.setdefault(parent_type.lower(), {})[kind] = newest
+
+def records_by_id(items: list[dict]) -> dict[str, dict]:
+    """Clio items keyed by id (as str), without the id in the record."""
+    return {str(item['id']): {k: v for k, v in item.items() if k != 'id'} for item in items}
+
+def changed_items(items: list[dict], stored: dict) -> list[dict]:
+    """The `items` whose record differs from the stored one. `updated_since` is inclusive, so every delta repeats the newest record."""
+    return [item for item, (record_id, record) in zip(items, records_by_id(items).items()) if stored.get(record_id) != record]
+
+def other_parent_types(records: dict, parent_type: str) -> dict:
+    """The stored records that belong to another parent type, kept when one type is reloaded."""
+    return {record_id: data for record_id, data in records.items() if (data.get('parent_type') or 'Matter').lower() != parent_type.lower()}
+
+def build_sorted_id_lists(items: list[dict]) -> tuple[dict[str, list[int]], bool]:
+    """
+    Field ids per parent type by display_order, and whether any display_order is duplicated,
+    skipped or does not start at 0 (moves write the 0-based position).
+    """
+    grouped = defaultdict(list)
+    for item in items:
+        grouped[item['parent_type'].lower()].append((item['display_order'], item['id']))
+
+    sorted_ids = {}
+    inconsistencies_found = False
+    for parent_type, pairs in grouped.items():
+        seen_orders = {order for order, _ in pairs}
+        if len(seen_orders) != len(pairs) or seen_orders != set(range(len(pairs))):
+            inconsistencies_found = True
+        sorted_ids[parent_type] = [item_id for _, item_id in sorted(pairs)]
+
+    return sorted_ids, inconsistencies_found
+
+def store_custom_fields(parent_type: str, items: list[dict], id_lists: dict[str, list[int]]) -> None:
+    """Replace the stored fields of `parent_type` with a full load, leaving other parent types alone."""
+    storage = get_storage()
+    with storage.transaction():
+        for list_parent_type, id_list in id_lists.items():
+            storage.setdefault(list_parent_type, {})['custom_field_id_list'] = id_list
+        storage.setdefault(parent_type.lower(), {}).setdefault('custom_field_id_list', [])
+
+        storage['custom_field_data'] = other_parent_types(storage['custom_field_data'], parent_type) | records_by_id(items)
+        sync_field_indexes()
+        advance_high_water_mark(parent_type, 'custom_fields', items)
+
+def store_custom_field_sets(parent_type: str, items: list[dict]) -> None:
+    """Replace the stored field sets of `parent_type` with a full load, leaving other parent types alone."""
+    storage = get_storage()
+    with storage.transaction():
+        storage['custom_field_set_data'] = other_parent_types(storage['custom_field_set_data'], parent_type) | records_by_id(items)
+        rebuild_field_set_lists(parent_type)
+        advance_high_water_mark(parent_type, 'custom_field_sets', items)
+    sync_field_set_indexes()
+
+def rebuild_field_set_lists(parent_type: str) -> None:
+    """Re-derive the per-type set id lists (by name) from the stored set records."""
+    storage = get_storage()
+
+    named: defaultdict[str, list[tuple[str, int]]] = defaultdict(list)
+    for set_id, data in storage['custom_field_set_data'].items():
+        named[(data.get('parent_type') or 'Matter').lower()].append(((data.get('name') or '').lower(), int(set_id)))
+
+    named.setdefault(parent_type.lower(), [])
+    for list_parent_type, sets in named.items():
+        storage.setdefault(list_parent_type, {})['custom_field_set_id_list'] = [set_id for _, set_id in sorted(sets)]
+
+async def prefetch_parent_type(parent_type: str, client=None) -> None:
+    """Load another parent type's fields and sets into storage (and the etag cache) ahead of its page."""
+    fields, field_sets = await asyncio.gather(
+        get_custom_fields_async(client, parent_type),
+        get_custom_field_sets_async(client, parent_type),
+    )
+    if fields:
+        data = fields.get('data', [])
+        id_lists, has_inconsistencies = build_sorted_id_lists(data)
+        # Broken display_orders are left for that page's fix dialog
+        if not has_inconsistencies:
+            store_custom_fields(parent_type, data, id_lists)
+    if field_sets:
+        store_custom_field_sets(parent_type, field_sets.get('data', []))
+    logging.debug(f"Prefetched custom fields for {parent_type}")
+
+async def normalize_display_orders(parent_type: str, moves: list[Move], client=None, max_concurrency: int = 4) -> tuple[DispatchReport, bool]:
+    """
+    Send the display_order PATCHes planned by `plan_normalization` and check Clio afterwards.
+
+    The moves set absolute values and go out concurrently in one wave. If Clio still reports
+    gaps or duplicates (it shifts neighbours on some writes), the remaining fixes are planned
+    again from the fresh state and sent one at a time. Returns the last report and whether
+    the order verified clean.
+    """
+    report = DispatchReport()
+    waves = [[(move.field_id, lambda move=move: update_custom_field_display_order_async(move.field_id, move.index, client, store=False)) for move in moves]]
+    for attempt in range(2):
+        if waves and waves[0]:
+            report = await Dispatcher(max_concurrency).run(waves, on_wave=store_display_order_results)
+
+        response = await get_custom_fields_async(client, parent_type, max_age=0)
+        if not response:
+            return report, False
+        data = response.get('data', [])
+        if not build_sorted_id_lists(data)[1]:
+            logging.debug(f"Display orders of {parent_type} fields verified after {attempt + 1} pass(es)")
+            return report, True
+
+        moves = plan_normalization({item['id']: item['display_order'] for item in data})
+        waves = [[(move.field_id, lambda move=move: update_custom_field_display_order_async(move.field_id, move.index, client, store=False))] for move in moves]
+
+    return report, False
+
+class DeltaSync:
+    """
+    Pull only the fields and field sets Clio changed since the last high-water mark.
+
+    Renames, deletes and fields appended at the end are merged into storage and pushed to
+    the affected cards. A changed display_order shifts fields Clio does not report, so it
+    falls back to a full (etag-revalidated) load, as does every FULL_SYNC_EVERY-th run to
+    pick up hard-deleted field sets.
+    """
+
+    FULL_SYNC_EVERY = 10
+
+    def __init__(self, parent_type: str, field_container: 'FieldContainer', field_set_container: 'FieldSetContainer', commit_queue: 'CommitQueue' = None, api_client=None) -> None:
+        self.parent_type = parent_type.lower()
+        self.field_container = field_container
+        self.field_set_container = field_set_container
+        self.commit_queue = commit_queue
+        # The tab's client, passed explicitly since the gathered loads run in tasks without the tab's context
+        self.api_client = api_client
+        self.lock = asyncio.Lock()
+        self.runs = 0
+        # True while a full load revalidates what the page shows
+        self.revalidating = False
+
+    def local_generation(self) -> int:
+        return self.commit_queue.generation if self.commit_queue else 0
+
+    def changed_locally(self, generation: int) -> bool:
+        """Whether the user changed (or is still sending) anything since `generation` was read."""
+        return bool(self.commit_queue) and self.commit_queue.changed_since(generation)
+
+    async def in_page(self, coroutine):
+        """Await `coroutine` inside the page, for child tasks (gather) that start without a slot."""
+        with self.field_container.client:
+            return await coroutine
+
+    async def run(self) -> None:
+        # Never merge on top of optimistic changes that are still being sent
+        if self.lock.locked() or (self.commit_queue and self.commit_queue.busy):
+            return
+
+        async with self.lock:
+            self.runs += 1
+            try:
+                if self.runs % self.FULL_SYNC_EVERY == 0:
+                    await self.load(background=True)
+                    return
+                await self.sync_fields()
+                await self.sync_field_sets()
+            except Exception as e:
+                logging.debug(f"An error occurred: {e}")
+
+    async def revalidate(self, force: bool = False, background: bool = False) -> None:
+        """Full (conditional) load of fields and field sets, waiting for a delta sync in progress."""
+        async with self.lock:
+            await self.load(force=force, background=background)
+
+    async def load(self, force: bool = False, background: bool = False) -> None:
+        self.revalidating = True
+        try:
+            # Independent requests, the slower one sets the wait
+            await asyncio.gather(
+                self.in_page(self.field_container.load_from_api(self.api_client, force=force, background=background)),
+                self.in_page(self.field_set_container.load_from_api(self.api_client, force=force)),
+            )
+            # Set cards name their fields, which may have landed after the sets
+            self.field_set_container.refresh()
+        finally:
+            self.revalidating = False
+
+    async def stream(self, on_page=None) -> None:
+        """Cold-start load that draws fields page by page, `on_page` runs after each one."""
+        async with self.lock:
+            self.revalidating = True
+            try:
+                await asyncio.gather(
+                    self.in_page(self.field_container.stream_from_api(self.api_client, on_page=on_page)),
+                    self.in_page(self.field_set_container.load_from_api(self.api_client)),
+                )
+                self.field_set_container.refresh()
+            finally:
+                self.revalidating = False
+
+    async def sync_fields(self) -> None:
+        since = high_water_mark(self.parent_type, 'custom_fields')
+        if since is None:
+            await self.field_container.load_from_api(self.api_client, background=True)
+            return
+
+        generation = self.local_generation()
+        response = await get_custom_fields_async(self.api_client, self.parent_type, updated_since=since)
+        items = response.get('data', []) if response else []
+        if not items:
+            return
+        # The user moved fields while this was in flight, the mark is unchanged so the next run retries
+        if self.changed_locally(generation):
+            logging.debug("Delta sync: local changes while fetching fields, skipped")
+            return
+
+        field_data = get_storage()['custom_field_data']
+        items = changed_items(items, field_data)
+        if not items:
+            return
+        max_order = field_indexes.max_display_order(self.parent_type)
+        appended = []
+        for item in items:
+            stored = field_data.get(str(item['id']))
+            if stored is None and (max_order is None or item.get('display_order', -1) > max_order):
+                appended.append(item)
+            elif stored is None or stored.get('display_order') != item.get('display_order'):
+                logging.debug(f"Delta sync: display_order changed for {self.parent_type}, reloading fields")
+                await self.field_container.load_from_api(self.api_client, force=True, background=True)
+                return
+
+        with get_storage().transaction():
+            for field_id, record in records_by_id(items).items():
+                field_data[field_id] = record
+                index_custom_field(field_id, record)
+            if appended:
+                self.field_container.order.extend(item['id'] for item in sorted(appended, key=lambda item: item['display_order']))
+                self.field_container.persist_order()
+            advance_high_water_mark(self.parent_type, 'custom_fields', items)
+
+        logging.debug(f"Delta sync: merged {len(items)} field(s), {len(appended)} new")
+        self.field_container.update_cards([item['id'] for item in items])
+        # Set cards show field names
+        self.field_set_container.refresh()
+
+    async def sync_field_sets(self) -> None:
+        since = high_water_mark(self.parent_type, 'custom_field_sets')
+        if since is None:
+            await self.field_set_container.load_from_api(self.api_client)
+            return
+
+        generation = self.local_generation()
+        response = await get_custom_field_sets_async(self.api_client, self.parent_type, updated_since=since)
+        items = response.get('data', []) if response else []
+        if not items or self.changed_locally(generation):
+            return
+
+        storage = get_storage()
+        set_data = storage['custom_field_set_data']
+        items = changed_items(items, set_data)
+        if not items:
+            return
+        with storage.transaction():
+            for set_id, record in records_by_id(items).items():
+                set_data[set_id] = record
+                index_field_set(set_id, record)
+            rebuild_field_set_lists(self.parent_type)
+            advance_high_water_mark(self.parent_type, 'custom_field_sets', items)
+
+        logging.debug(f"Delta sync: merged {len(items)} field set(s)")
+        self.field_set_container.refresh()
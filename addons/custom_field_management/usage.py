@@ -0,0 +1,286 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from nicegui import run
+
+from .api import resolve_async_client
+from .storage import STORAGE_PATH
+
+logging.basicConfig(level=logging.DEBUG)
+
+MATTER_USAGE_FIELDS = "id,display_number,description,updated_at,custom_field_values{id,value,custom_field}"
+
+# Matters per page when the index answers "containing matters"
+INDEX_PAGE_SIZE = 200
+
+def utc_timestamp(value: Optional[str]) -> Optional[str]:
+    """Clio timestamps carry their own offset, stored as UTC so they sort as text."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc).isoformat()
+    except ValueError:
+        return None
+
+class UsageIndex:
+    """
+    On-disk index of which matters hold which custom fields for one Clio token, next to
+    the storage database.
+
+    `postings` has one row per (field, matter) with whether the value is non-empty, and
+    `field_usage` the per-field counts. Updating a batch of matters replaces only their
+    postings and recounts only the fields they touched; the newest matter `updated_at`
+    is kept as the high-water mark for the next `updated_since` update. Counts and the
+    mark are mirrored in memory so the field cards never wait on the disk.
+
+    Writes and page queries run in worker threads (`run.io_bound`), one at a time under
+    `lock`; a full recount over every posting would otherwise stall every client.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS matters (
+            matter_id INTEGER PRIMARY KEY,
+            display_number TEXT,
+            description TEXT,
+            updated_at TEXT,
+            scan INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            field_id INTEGER NOT NULL,
+            matter_id INTEGER NOT NULL,
+            has_value INTEGER NOT NULL,
+            PRIMARY KEY (field_id, matter_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_matter ON postings (matter_id);
+        CREATE TABLE IF NOT EXISTS field_usage (
+            field_id INTEGER PRIMARY KEY,
+            matters INTEGER NOT NULL,
+            "values" INTEGER NOT NULL,
+            last_used TEXT
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+        self.lock = threading.RLock()
+        self.mark = self.get_meta('high_water_mark')
+        self.usage: dict[int, dict] = {
+            field_id: {'matters': matters, 'values': values, 'last_used': last_used}
+            for field_id, matters, values, last_used in self.connection.execute('SELECT field_id, matters, "values", last_used FROM field_usage')
+        }
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def high_water_mark(self) -> Optional[str]:
+        return self.mark
+
+    @property
+    def ready(self) -> bool:
+        """True once a full scan has completed."""
+        return self.high_water_mark is not None
+
+    def apply_matters(self, matters: list[dict], scan: int = 0) -> set[int]:
+        """Replace the postings of `matters` and return every field id whose counts may have changed."""
+        matter_ids = [matter['id'] for matter in matters]
+        if not matter_ids:
+            return set()
+
+        placeholders = ','.join('?' * len(matter_ids))
+        with self.lock, self.connection:
+            touched = {row[0] for row in self.connection.execute(f'SELECT DISTINCT field_id FROM postings WHERE matter_id IN ({placeholders})', matter_ids)}
+            self.connection.execute(f'DELETE FROM postings WHERE matter_id IN ({placeholders})', matter_ids)
+
+            postings = []
+            newest = None
+            for matter in matters:
+                updated_at = utc_timestamp(matter.get('updated_at'))
+                if updated_at and (newest is None or updated_at > newest):
+                    newest = updated_at
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO matters (matter_id, display_number, description, updated_at, scan) VALUES (?, ?, ?, ?, ?)',
+                    (matter['id'], matter.get('display_number'), matter.get('description'), updated_at, scan),
+                )
+                for value in matter.get('custom_field_values') or []:
+                    field = value.get('custom_field') or {}
+                    if 'id' in field:
+                        postings.append((field['id'], matter['id'], int(value.get('value') not in (None, '', []))))
+            self.connection.executemany('INSERT OR REPLACE INTO postings (field_id, matter_id, has_value) VALUES (?, ?, ?)', postings)
+            # Promoted once the run's counts are in, an interrupted run starts again from the old mark
+            pending = self.get_meta('pending_high_water_mark')
+            if newest and (pending is None or newest > pending):
+                self.set_meta('pending_high_water_mark', newest)
+
+        return touched | {field_id for field_id, _, _ in postings}
+
+    def finish_update(self, field_ids: set[int]) -> None:
+        """Recount the fields an incremental run touched and move the high-water mark."""
+        with self.lock:
+            self.recount(field_ids)
+            self.promote_high_water_mark()
+
+    def finish_scan(self, scan: int) -> None:
+        """Drop matters a full scan did not see (deleted in Clio) and recount every field."""
+        with self.lock:
+            with self.connection:
+                self.connection.execute('DELETE FROM postings WHERE matter_id IN (SELECT matter_id FROM matters WHERE scan != ?)', (scan,))
+                self.connection.execute('DELETE FROM matters WHERE scan != ?', (scan,))
+                self.connection.execute('UPDATE matters SET scan = 0')
+                self.connection.execute('DELETE FROM field_usage')
+            self.recount(None)
+            self.promote_high_water_mark()
+
+    def promote_high_water_mark(self) -> None:
+        with self.lock, self.connection:
+            pending = self.get_meta('pending_high_water_mark')
+            current = self.high_water_mark
+            # An empty account still counts as scanned
+            newest = max(filter(None, (pending, current)), default=datetime.now(timezone.utc).isoformat())
+            self.set_meta('high_water_mark', newest)
+            self.connection.execute('DELETE FROM meta WHERE key = ?', ('pending_high_water_mark',))
+        self.mark = newest
+
+    def recount(self, field_ids: Optional[set[int]]) -> None:
+        """Recompute the counts of `field_ids` (all fields for None) from their postings."""
+        if field_ids is not None and not field_ids:
+            return
+        where, params = '', []
+        if field_ids is not None:
+            params = list(field_ids)
+            where = f'WHERE p.field_id IN ({",".join("?" * len(params))})'
+
+        with self.lock, self.connection:
+            rows = self.connection.execute(f'''
+                SELECT p.field_id, COUNT(*), SUM(p.has_value), MAX(CASE WHEN p.has_value THEN m.updated_at END)
+                FROM postings p JOIN matters m ON m.matter_id = p.matter_id
+                {where}
+                GROUP BY p.field_id
+            ''', params).fetchall()
+            if field_ids is not None:
+                self.connection.execute(f'DELETE FROM field_usage WHERE field_id IN ({",".join("?" * len(params))})', params)
+            self.connection.executemany('INSERT OR REPLACE INTO field_usage (field_id, matters, "values", last_used) VALUES (?, ?, ?, ?)', rows)
+
+        # Swapped in whole, readers on the event loop never see a half-updated mapping
+        usage = {} if field_ids is None else {field_id: data for field_id, data in self.usage.items() if field_id not in field_ids}
+        for field_id, matters, values, last_used in rows:
+            usage[field_id] = {'matters': matters, 'values': values or 0, 'last_used': last_used}
+        self.usage = usage
+
+    def matters_page(self, field_id: int, after_id: int = -1, page_size: int = INDEX_PAGE_SIZE) -> list[dict]:
+        """One page of the indexed matters holding a value record for `field_id`, by matter id after `after_id`."""
+        with self.lock:
+            rows = self.connection.execute('''
+                SELECT m.matter_id, m.display_number, m.description
+                FROM postings p JOIN matters m ON m.matter_id = p.matter_id
+                WHERE p.field_id = ? AND p.matter_id > ?
+                ORDER BY p.matter_id LIMIT ?
+            ''', (int(field_id), after_id, page_size)).fetchall()
+        return [{'id': matter_id, 'display_number': display_number, 'description': description} for matter_id, display_number, description in rows]
+
+    def close(self) -> None:
+        self.connection.close()
+
+def usage_index_path(access_token: str) -> Path:
+    """One database per token so accounts never see each other's matters, named by a hash to keep the token off disk."""
+    return STORAGE_PATH / f"usage-{hashlib.sha256(access_token.encode()).hexdigest()[:16]}.sqlite3"
+
+_usage_indexes: dict[str, UsageIndex] = {}
+
+def get_usage_index(access_token: str, create: bool = False) -> Optional[UsageIndex]:
+    """The token's index, None when it was never analyzed. Only an analysis run creates the file."""
+    index = _usage_indexes.get(access_token)
+    if index is None:
+        path = usage_index_path(access_token)
+        # Reads must not leave a database behind for every partially typed or invalid token
+        if not create and not path.exists():
+            return None
+        index = _usage_indexes[access_token] = UsageIndex(path)
+    return index
+
+def close_usage_indexes() -> None:
+    for index in _usage_indexes.values():
+        index.close()
+    _usage_indexes.clear()
+
+class UsageAnalysis:
+    """
+    Keep the usage index in line with Clio.
+
+    The first run (or `full=True`) streams every matter's custom_field_values and drops
+    matters that were not seen; later runs only fetch matters `updated_since` the index's
+    high-water mark. Hard-deleted matters are only dropped by a full run. Runs and their
+    progress are kept per token.
+    """
+
+    def __init__(self) -> None:
+        self.running: set[str] = set()
+        self.status: dict[str, str] = {}
+
+    def is_running(self, access_token: str) -> bool:
+        return access_token in self.running
+
+    async def run(self, client=None, full: bool = False) -> dict[int, dict]:
+        client = resolve_async_client(client)
+        token = client.access_token
+        index = get_usage_index(token, create=True)
+        if token in self.running:
+            return index.usage
+
+        full = full or not index.ready
+        params = {"fields": MATTER_USAGE_FIELDS}
+        if not full:
+            params["updated_since"] = index.high_water_mark
+        # A full scan tags every matter it sees with its own id
+        scan = time.time_ns() if full else 0
+
+        self.running.add(token)
+        started = time.perf_counter()
+        touched: set[int] = set()
+        matter_count = 0
+        try:
+            async for page, _ in client.pages("matters.json", conditional=False, **params):
+                touched |= await run.io_bound(index.apply_matters, page, scan) or set()
+                matter_count += len(page)
+                self.status[token] = f'Reading matters: {matter_count}'
+
+            self.status[token] = f'Counting usage over {matter_count} matters'
+            if full:
+                await run.io_bound(index.finish_scan, scan)
+            else:
+                await run.io_bound(index.finish_update, touched)
+            logging.debug(f"Usage index {'rebuilt from' if full else 'updated with'} {matter_count} matters in {time.perf_counter() - started:.1f}s")
+            return index.usage
+        finally:
+            self.running.discard(token)
+            self.status.pop(token, None)
+
+# One update at a time per token, its result is shared through that token's index
+usage_analysis = UsageAnalysis()
+
+def field_usage(field_id, access_token: str) -> dict:
+    """Indexed usage of a field for a token: None before its first scan, zero counts for a field no matter uses."""
+    if not access_token:
+        return None
+    index = get_usage_index(access_token)
+    if index is None or not index.ready:
+        return None
+    return index.usage.get(int(field_id), {'matters': 0, 'values': 0, 'last_used': None})